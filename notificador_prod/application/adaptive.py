@@ -0,0 +1,92 @@
+import os
+import logging
+import resource
+from config.settings import (
+    CHUNK_SIZE_MIN, CHUNK_SIZE_MAX, TARGET_CYCLE_SECONDS, MEMORY_LIMIT_MB, TWILIO_RATE_LIMIT,
+)
+
+logger = logging.getLogger("notifier")
+
+def current_rss_mb():
+    """RSS atual do processo em MB (/proc no Linux; senão o pico do getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class AdaptiveController:
+    """
+    Ajusta chunk_size e o intervalo entre ciclos a partir do último ciclo:
+    1) Latência: ciclo acima de TARGET_CYCLE_SECONDS encolhe o chunk na mesma
+       proporção; ciclo rápido com backlog sobrando dobra o chunk.
+    2) Provedor: o envio não passa de TWILIO_RATE_LIMIT msg/s, então o chunk
+       é limitado ao que cabe em TARGET_CYCLE_SECONDS no ritmo da conta.
+    3) Memória: acima de 80% de MEMORY_LIMIT_MB o chunk cai pela metade.
+    4) Backlog: a estimativa do planner (nunca menor que 1 e sujeita a
+       estatísticas velhas) só vale junto com o próprio ciclo. Reserva que
+       não encheu o chunk + estimativa pequena = backlog acabou (pausa
+       crescente até sleep_max); reserva cheia = ainda há trabalho (sem pausa,
+       e o chunk não encolhe pela estimativa).
+    Sempre dentro de [CHUNK_SIZE_MIN, CHUNK_SIZE_MAX]; cada decisão é logada.
+    """
+
+    def __init__(self, chunk_size, sleep_max, chunk_min=CHUNK_SIZE_MIN, chunk_max=CHUNK_SIZE_MAX,
+                 target_seconds=TARGET_CYCLE_SECONDS, memory_limit_mb=MEMORY_LIMIT_MB,
+                 rate_limit=TWILIO_RATE_LIMIT):
+        self.chunk_min = chunk_min
+        self.chunk_max = max(chunk_min, chunk_max)
+        self.chunk_size = self._clamp(chunk_size)
+        self.sleep_max = sleep_max
+        self.delay = 0.0
+        self.target_seconds = target_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self.rate_limit = rate_limit
+
+    def _clamp(self, value):
+        return int(min(self.chunk_max, max(self.chunk_min, value)))
+
+    def update(self, cycle_seconds, messages, backlog):
+        """
+        Recebe a duração do ciclo, as mensagens tentadas (telefones reservados)
+        e o backlog estimado restante; retorna (novo chunk_size, pausa em
+        segundos até o próximo ciclo).
+        """
+        size = self.chunk_size
+        drained = messages < self.chunk_size  # a reserva não encheu o chunk
+        reasons = []
+
+        if cycle_seconds > self.target_seconds:
+            size *= max(0.5, self.target_seconds / cycle_seconds)
+            reasons.append(f"ciclo lento ({cycle_seconds:.1f}s)")
+        elif backlog > size and cycle_seconds < self.target_seconds / 2:
+            size *= 2
+            reasons.append(f"ciclo rápido ({cycle_seconds:.1f}s) e backlog {backlog}")
+
+        send_budget = self.rate_limit * self.target_seconds
+        if messages > send_budget:
+            size *= send_budget / messages
+            reasons.append(f"limite do provedor ({self.rate_limit:g} msg/s)")
+
+        rss = current_rss_mb()
+        if rss > 0.8 * self.memory_limit_mb:
+            size /= 2
+            reasons.append(f"memória ({rss:.0f}/{self.memory_limit_mb} MB)")
+
+        if drained and backlog < size:
+            size = max(backlog, messages)
+            reasons.append(f"backlog restante (~{backlog})")
+
+        if drained and backlog < self.chunk_size:
+            delay = min(self.sleep_max, max(1.0, self.delay * 2))
+        else:
+            delay = 0.0
+
+        new_size = self._clamp(size)
+        if new_size != self.chunk_size or delay != self.delay:
+            logger.info(
+                f"Adaptativo: chunk_size {self.chunk_size} -> {new_size}, pausa {self.delay:.0f}s -> {delay:.0f}s"
+                + (f" ({'; '.join(reasons)})" if reasons else "")
+            )
+        self.chunk_size, self.delay = new_size, delay
+        return self.chunk_size, self.delay
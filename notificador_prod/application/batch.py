@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+from collections import deque, Counter
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from config.settings import CLASSIFY_PROCESSES, BATCH_CHUNK_ROWS, BATCH_PARTITIONS, BATCH_PARTITION_BYTES
+from domain.exam_utils import classify_exams_batch, build_message_for_exams
+
+logger = logging.getLogger("notifier")
+
+SPILL_COLUMNS = ["seq", "tel", "solicitante", "exame", "ex_type"]
+
+def bounded_map(pool, fn, items, limit):
+    """Como pool.map, mas com no máximo 'limit' tarefas em andamento (memória constante), em ordem."""
+    in_flight = deque()
+    for item in items:
+        in_flight.append(pool.submit(fn, *item))
+        if len(in_flight) >= limit:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+def read_export_chunks(path, chunk_rows):
+    """
+    Lê uma exportação CSV (formato de data/sample_*.csv) em chunks de 'chunk_rows'
+    linhas, só com as colunas usadas; sem CD_TUSS, o chunk vem com cd_tuss vazio.
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    usecols = [c for c in header if c.upper() in ("TEL", "SOLICITANTE", "CD_TUSS", "DS_RECEITA")]
+    reader = pd.read_csv(path, usecols=usecols, dtype=str, keep_default_na=False,
+                         na_values=[""], chunksize=chunk_rows)
+    for chunk in reader:
+        chunk.columns = [c.lower() for c in chunk.columns]
+        if "cd_tuss" not in chunk:
+            chunk["cd_tuss"] = None
+        yield chunk
+
+def classify_chunk(chunk, first_seq, partitions):
+    """
+    Roda no pool de processos: classifica o chunk (classify_exams_batch) e
+    devolve {partição: linhas (seq, tel, solicitante, exame, ex_type)}, com a
+    partição escolhida pelo hash do telefone.
+    """
+    chunk = chunk.dropna(subset=["tel"]).copy()
+    chunk["seq"] = range(first_seq, first_seq + len(chunk))
+    exams = classify_exams_batch(chunk["cd_tuss"], chunk["ds_receita"])
+    rows = chunk[["seq", "tel", "solicitante"]].join(exams)
+    part = pd.util.hash_pandas_object(rows["tel"], index=False) % partitions
+    return {int(p): group[SPILL_COLUMNS] for p, group in rows.groupby(part.to_numpy(), sort=False)}
+
+def split_partition(path, parts, depth, chunk_rows):
+    """
+    Roda no pool de processos: redistribui uma partição grande demais em 'parts'
+    arquivos pelo hash do telefone com outra chave (a da divisão anterior não
+    espalharia), lendo em chunks, e apaga a original. Devolve os arquivos gerados.
+    """
+    hash_key = f"particao{depth:08d}"  # 16 caracteres, como exige hash_pandas_object
+    sub_paths = [f"{path}.{i}" for i in range(parts)]
+    reader = pd.read_csv(path, names=SPILL_COLUMNS, dtype={"tel": str}, keep_default_na=False,
+                         chunksize=chunk_rows)
+    for rows in reader:
+        part = pd.util.hash_pandas_object(rows["tel"], index=False, hash_key=hash_key) % parts
+        for p, group in rows.groupby(part.to_numpy(), sort=False):
+            group.to_csv(sub_paths[int(p)], mode="a", header=False, index=False)
+    os.remove(path)
+    return [p for p in sub_paths if os.path.exists(p)]
+
+def fit_partitions(pool, paths, max_bytes, chunk_rows, limit):
+    """
+    Re-divide (em paralelo) as partições maiores que 'max_bytes' até caberem,
+    mantendo a ordem. Uma partição que não se divide (um único telefone com
+    registros demais) segue como está.
+    """
+    depth, unsplittable = 0, set()
+    while oversized := [p for p in paths if p not in unsplittable and os.path.getsize(p) > max_bytes]:
+        depth += 1
+        jobs = [(p, max(2, -(-os.path.getsize(p) // max_bytes)), depth, chunk_rows) for p in oversized]
+        splits = dict(zip(oversized, bounded_map(pool, split_partition, jobs, limit)))
+        unsplittable.update(subs[0] for subs in splits.values() if len(subs) == 1)
+        paths = [sub for p in paths for sub in splits.get(p, [p])]
+        logger.info(f"Batch: {len(oversized)} partições acima de {max_bytes} bytes re-divididas "
+                    f"({len(paths)} partições).")
+    return paths
+
+def finalize_partition(path, out_path):
+    """
+    Roda no pool de processos: agrupa por telefone uma partição do disco (até
+    'partition_bytes', cabe em memória) e grava os registros prontos para envio
+    em 'out_path' (JSONL), um por vez. Devolve só (telefones, contagem por tipo).
+    """
+    rows = pd.read_csv(path, names=SPILL_COLUMNS, dtype={"tel": str}, keep_default_na=False)
+    rows = rows.sort_values("seq", kind="stable")
+    rows["exam"] = list(zip(rows["exame"], rows["ex_type"]))
+    grouped = rows.groupby("tel", sort=False).agg(
+        client_name=("solicitante", "first"),
+        exams=("exam", lambda exams: list(dict.fromkeys(exams))),
+    )
+    exam_types = Counter()
+    with open(out_path, "w", encoding="utf-8") as out:
+        for tel, client_name, exams in grouped.itertuples():
+            record = {
+                "tel": tel,
+                "client_name": client_name,
+                "exams": exams,
+                "message": build_message_for_exams(client_name, exams),
+            }
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            exam_types.update(ex_type for _, ex_type in exams)
+    return len(grouped), exam_types
+
+def run_batch(paths, out_path, chunk_rows=BATCH_CHUNK_ROWS, partitions=BATCH_PARTITIONS,
+              partition_bytes=BATCH_PARTITION_BYTES, processes=CLASSIFY_PROCESSES, tmp_dir=None):
+    """
+    Processa exportações CSV sem banco, com memória limitada:
+    1) Lê cada arquivo em chunks e classifica no pool de processos (no máximo
+       2 chunks por processo em andamento; resultados consumidos em ordem).
+    2) Espalha as linhas classificadas em 'partitions' arquivos temporários
+       pelo hash do telefone (todos os registros de um telefone na mesma partição);
+       as que passarem de 'partition_bytes' são re-divididas, para que cada
+       processo só carregue uma partição limitada, qualquer que seja a entrada.
+    3) Agrupa cada partição por telefone (em paralelo); cada processo grava a
+       sua parte da outbox no disco e as partes são concatenadas em ordem no
+       JSONL final: {tel, client_name, exams, message}, uma linha por telefone.
+    4) Grava o resumo em '<out_path>.summary.json' e o retorna.
+    """
+    started = time.perf_counter()
+    processes = max(1, processes)
+    spill_dir = tempfile.mkdtemp(prefix="notificador-batch-", dir=tmp_dir)
+    part_paths = [os.path.join(spill_dir, f"part-{p:04d}.csv") for p in range(partitions)]
+    rows_by_file = {}
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            def chunks():
+                seq = 0
+                for path in paths:
+                    rows_by_file[path] = 0
+                    for chunk in read_export_chunks(path, chunk_rows):
+                        yield chunk, seq, partitions
+                        seq += len(chunk)
+                        rows_by_file[path] += len(chunk)
+                    logger.info(f"Batch: {rows_by_file[path]} linhas lidas de {path}.")
+
+            for parts in bounded_map(pool, classify_chunk, chunks(), 2 * processes):
+                for p, rows in parts.items():
+                    rows.to_csv(part_paths[p], mode="a", header=False, index=False)
+
+            phones = 0
+            exam_types = Counter()
+            existing = fit_partitions(pool, [p for p in part_paths if os.path.exists(p)],
+                                      partition_bytes, chunk_rows, 2 * processes)
+            jobs = [(p, p + ".jsonl") for p in existing]
+            with open(out_path, "wb") as out:
+                for (_, part_out), (count, types) in zip(
+                        jobs, bounded_map(pool, finalize_partition, jobs, 2 * processes)):
+                    with open(part_out, "rb") as f:
+                        shutil.copyfileobj(f, out)
+                    os.remove(part_out)
+                    phones += count
+                    exam_types.update(types)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    rows = sum(rows_by_file.values())
+    summary = {
+        "files": rows_by_file,
+        "rows": rows,
+        "phones": phones,
+        "exams_by_type": dict(exam_types),
+        "outbox": out_path,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed) if elapsed else None,
+    }
+    with open(out_path + ".summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    logger.info(f"Batch: {rows} linhas, {phones} telefones em {elapsed:.1f}s ({summary['rows_per_second']} linhas/s). "
+                f"Outbox: {out_path}")
+    return summary
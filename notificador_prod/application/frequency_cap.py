@@ -0,0 +1,76 @@
+import time
+import logging
+import threading
+from infrastructure.database import load_recent_notifications, prune_recent_notifications, defer_tels
+from infrastructure.metrics import inc, set_gauge
+from domain.frequency_cap import RecentlyNotified
+
+logger = logging.getLogger("notifier")
+
+SYNC_OVERLAP_SECONDS = 300  # releitura de segurança: envios de outras réplicas com commit atrasado
+PRUNE_INTERVAL_SECONDS = 3600
+DEFER_REASON = "frequency_cap"
+
+class FrequencyCap:
+    """
+    Limite de frequência por telefone:
+    1) Os envios ficam em notification_recent (gravados na marcação, junto com
+       notified=true) e em memória em um RecentlyNotified (12 bytes por telefone).
+    2) A cada ciclo, sync() lê só os envios novos do banco (de todas as réplicas);
+       a primeira leitura carrega a janela inteira (reinícios não perdem o histórico).
+    3) filter(): telefone reservado que recebeu mensagem há menos de 'window_seconds'
+       vai para a outbox até o fim da janela, sem contar tentativa. Os exames
+       que chegarem até lá saem juntos em uma única mensagem.
+    """
+
+    def __init__(self, window_seconds):
+        self.window_seconds = window_seconds
+        self.recent = RecentlyNotified()
+        self._synced_until = None
+        self._pruned_at = 0.0
+        self._lock = threading.Lock()
+
+    def sync(self, conn):
+        """Carrega os envios gravados desde a última leitura e, de hora em hora, descarta os vencidos."""
+        with self._lock:
+            now = time.time()
+            if self._synced_until is None:
+                since = latest = now - self.window_seconds
+            else:
+                since = self._synced_until - SYNC_OVERLAP_SECONDS
+                latest = self._synced_until  # a margem de releitura não faz o marco voltar
+            for rows in load_recent_notifications(conn, since):
+                self.recent.add_many(rows)
+                latest = max(latest, max(ts for _, ts in rows))
+            self._synced_until = latest
+            if now - self._pruned_at >= PRUNE_INTERVAL_SECONDS:
+                self.recent.prune(now - self.window_seconds)
+                removed = prune_recent_notifications(conn, self.window_seconds)
+                self._pruned_at = now
+                logger.info(f"Limite de frequência: {len(self.recent)} telefones na janela "
+                            f"(~{self.recent.nbytes / 2**20:.1f} MB), {removed} envios vencidos removidos do banco.")
+                set_gauge("notifier_frequency_cap_phones", len(self.recent))
+
+    def filter(self, conn, tels):
+        """
+        Retorna os telefones que podem receber mensagem agora; os demais são
+        adiados na outbox até 'window_seconds' depois do último envio.
+        """
+        self.sync(conn)
+        now = time.time()
+        deferred = {}
+        for tel in tels:
+            last = self.recent.last_notified(tel)
+            if last is not None and now - last < self.window_seconds:
+                deferred[tel] = last + self.window_seconds - now
+        if deferred:
+            defer_tels(conn, deferred, DEFER_REASON)
+            inc("notifier_frequency_capped_total", len(deferred))
+            logger.info(f"Limite de frequência: {len(deferred)} telefones notificados há menos de "
+                        f"{self.window_seconds}s adiados (exames novos agrupados no próximo envio).")
+        return [tel for tel in tels if tel not in deferred]
+
+    def record(self, tels):
+        """Registra em memória os envios já gravados no banco (mark_as_notified_by_tels)."""
+        now = int(time.time())
+        self.recent.add_many((tel, now) for tel in tels)
@@ -1,84 +1,412 @@
 import time
 import logging
-import pandas as pd
+import importlib.util
 from sqlalchemy import text
-from infrastructure.database import engine, mark_as_notified_by_tel
-from domain.exam_utils import classify_exam
-from infrastructure.twilio_client import send_notification
+from config.settings import (
+    WORKER_ID, LEASE_SECONDS, USE_LISTEN_NOTIFY, LISTEN_FALLBACK_SECONDS, USE_PIPELINE, METRICS_PORT,
+    CHUNK_SIZE, SLEEP_SECONDS, ADAPTIVE_CHUNKING, TENANTS_FILE, CLASSIFY_CACHE_DB, USE_PANDAS,
+    PRIORITY_SCHEDULING, SCHEMA_CHECK, READ_BACKEND, FREQUENCY_CAP_SECONDS,
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_BASE_DELAY, OUTBOX_MAX_DELAY, OUTBOX_QUOTA_DELAY, OUTBOX_TRANSIENT_DELAY,
+    OUTBOX_DEAD_RETENTION,
+)
+from infrastructure.database import (
+    get_engine, mark_as_notified_by_tels, ensure_service_tables, claim_pending_tels, release_claims,
+    record_send_failures, estimate_pending_rows, load_classifications, save_classifications,
+    ensure_notify_triggers, listen_for_inserts, wait_for_inserts, copy_query_csv, NOTIFY_TABLES,
+)
+from domain.exam_utils import (
+    CLASSIFIER_VERSION, CLASSIFICATION_CACHE, classify_exams, classify_exams_batch, lookup_tuss,
+    lookup_tuss_series, text_hash,
+)
+from infrastructure.schema import check_query_plans
+from infrastructure.leases import LeaseHeartbeat
+from infrastructure.dispatcher import dispatch_notifications
+from infrastructure.twilio_client import is_daily_limit_error, is_recipient_error
+from infrastructure.metrics import inc, timer, set_gauge, start_metrics_server
+from application.adaptive import AdaptiveController
+from application.frequency_cap import FrequencyCap
 
 logger = logging.getLogger("notifier")
 
-def infinite_loop(chunk_size=1000, sleep_seconds=30):
+# Limite de frequência do modo de banco único (no multi-tenant, cada Tenant tem o seu)
+FREQUENCY_CAP = FrequencyCap(FREQUENCY_CAP_SECONDS) if FREQUENCY_CAP_SECONDS > 0 else None
+
+def frequency_cap_for(tenant=None):
+    """FrequencyCap do tenant (ou o global); None se o limite de frequência estiver desligado."""
+    return FREQUENCY_CAP if tenant is None else tenant.frequency_cap
+
+def apply_frequency_cap(conn, tels, tenant=None):
+    """Telefones reservados que podem ser notificados agora (os demais são adiados na outbox)."""
+    cap = frequency_cap_for(tenant)
+    return tels if cap is None or not tels else cap.filter(conn, tels)
+
+# src: posição da tabela em NOTIFY_TABLES (1 ou 2); src/id identificam os registros a marcar
+READ_CLAIMED_SQL = text(
+    "SELECT tel, "
+    "(array_agg(solicitante ORDER BY src, id))[1] AS solicitante, "
+    "array_agg(cd_tuss ORDER BY src, id) AS cd_tuss, "
+    "array_agg(ds_receita ORDER BY src, id) AS ds_receita, "
+    "array_agg(src ORDER BY src, id) AS src, "
+    "array_agg(id ORDER BY src, id) AS id "
+    "FROM ("
+    "SELECT 1 AS src, id, tel, solicitante, cd_tuss, ds_receita "
+    "FROM public.dados_estruturados "
+    "WHERE NOT notified AND tel = ANY(:tels) "
+    "UNION ALL "
+    "SELECT 2, id, tel, solicitante, NULL, ds_receita "
+    "FROM public.dados_nao_estruturados "
+    "WHERE NOT notified AND tel = ANY(:tels)"
+    ") r "
+    "GROUP BY tel"
+)
+
+def read_claimed(conn, tels):
+    """
+    Lê os registros pendentes dos telefones reservados (as duas tabelas) já
+    agregados no banco: 1 linha por telefone com o solicitante e as listas
+    cd_tuss/ds_receita/src/id de todos os registros, sem repetir tel/solicitante por linha.
+    """
+    import pandas as pd  # Import local: o caminho sem pandas (USE_PANDAS=false) não o carrega
+    return pd.read_sql(READ_CLAIMED_SQL, conn, params={"tels": tels})
+
+def read_claimed_rows(conn, tels):
+    """Igual a read_claimed, sem pandas: lista de (tel, solicitante, [cd_tuss], [ds_receita], [src], [id])."""
+    rows = conn.execute(READ_CLAIMED_SQL, {"tels": tels}).all()
+    conn.commit()
+    return rows
+
+def explode_records(patients):
+    """Desfaz a agregação de read_claimed: 1 linha por registro (tel, solicitante, cd_tuss, ds_receita, src, id)."""
+    return patients.explode(["cd_tuss", "ds_receita", "src", "id"], ignore_index=True)
+
+# READ_BACKEND=copy: uma consulta por tabela; a ordem de READ_CLAIMED_SQL (tabela, id)
+# é refeita no cliente, evitando o sort no servidor
+COPY_CLAIMED_SQL = [
+    "SELECT id, tel, solicitante, cd_tuss, ds_receita FROM public.dados_estruturados "
+    "WHERE NOT notified AND tel = ANY(%(tels)s)",
+    "SELECT id, tel, solicitante, NULL, ds_receita FROM public.dados_nao_estruturados "
+    "WHERE NOT notified AND tel = ANY(%(tels)s)",
+]
+COPY_COLUMNS = ["id", "tel", "solicitante", "cd_tuss", "ds_receita"]
+RECORD_COLUMNS = ["tel", "solicitante", "cd_tuss", "ds_receita", "src", "id"]
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+def _parse_copy_csv(stream):
+    """CSV do COPY -> DataFrame ordenado por id (só 'id' numérico; os textos como str)."""
+    import pandas as pd  # Import local: o caminho sem pandas (USE_PANDAS=false) não o carrega
+    df = pd.read_csv(stream, names=COPY_COLUMNS, dtype={c: str for c in COPY_COLUMNS[1:]},
+                     keep_default_na=False, na_values=[""], engine="pyarrow" if HAS_PYARROW else "c")
+    return df.sort_values("id", kind="stable")
+
+def read_claimed_copy(conn, tels):
+    """
+    Mesmo resultado de explode_records(read_claimed(...)) com COPY:
+    1) COPY (SELECT ...) TO STDOUT em CSV das duas tabelas, uma após a outra
+       na conexão já reservada (copy_query_csv): não pede conexões extras ao
+       pool, que nos tenants é pequeno e sem overflow.
+    2) O CSV vai do pipe direto para colunas com pd.read_csv (parser C, ou
+       pyarrow se instalado) enquanto chega, sem objetos Python por linha,
+       result set do SQLAlchemy ou o CSV inteiro em memória.
+    """
+    import pandas as pd
+
+    frames = []
+    for src, sql in enumerate(COPY_CLAIMED_SQL, 1):
+        frame = copy_query_csv(conn, sql, {"tels": list(tels)}, _parse_copy_csv)
+        frame["src"] = src
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)[RECORD_COLUMNS]
+
+def read_claimed_records(conn, tels):
+    """Registros pendentes dos telefones reservados, 1 linha por registro, pelo READ_BACKEND configurado."""
+    if READ_BACKEND == "copy":
+        return read_claimed_copy(conn, tels)
+    return explode_records(read_claimed(conn, tels))
+
+def group_exams_by_tel(df, exams):
+    """
+    Junta a classificação (classify_exams_batch) aos registros e agrupa por
+    telefone: DataFrame indexado por tel com client_name e a lista de exames.
+    """
+    exams = df[["tel", "solicitante"]].join(exams)
+    exams["exam"] = list(zip(exams["exame"], exams["ex_type"]))
+    return exams.groupby("tel", sort=False).agg(
+        client_name=("solicitante", "first"),
+        exams=("exam", list),
+    )
+
+def warm_classification_cache(conn, texts):
+    """
+    Busca no cache persistente (CLASSIFY_CACHE_DB) os textos que não estão no
+    LRU em memória e os carrega nele. Retorna {hash: texto} dos que faltaram
+    nos dois níveis, para save_new_classifications gravar depois de classificar.
+    """
+    if not CLASSIFY_CACHE_DB:
+        return {}
+    pending = {text_hash(txt): txt for txt in texts if txt not in CLASSIFICATION_CACHE}
+    found = load_classifications(conn, pending, CLASSIFIER_VERSION)
+    for h, result in found.items():
+        CLASSIFICATION_CACHE.put(pending.pop(h), result)
+    inc("notifier_classify_cache_db_hits_total", len(found))
+    return pending
+
+def save_new_classifications(conn, pending):
+    """Grava no banco as classificações novas e atualiza a taxa de acerto do cache (métrica e log)."""
+    if pending:
+        new = {h: CLASSIFICATION_CACHE.peek(txt) for h, txt in pending.items()}
+        save_classifications(conn, {h: res for h, res in new.items() if res is not None}, CLASSIFIER_VERSION)
+    ratio = CLASSIFICATION_CACHE.hit_ratio()
+    set_gauge("notifier_classify_cache_hit_ratio", ratio)
+    set_gauge("notifier_classify_cache_entries", len(CLASSIFICATION_CACHE))
+    logger.info(f"Cache de classificação: {ratio:.1%} de acerto, {len(CLASSIFICATION_CACHE)} textos.")
+
+def classify_records(conn, df):
+    """Classifica os registros (classify_exams_batch) usando o cache em dois níveis."""
+    pending = {}
+    if CLASSIFY_CACHE_DB:
+        free_text = lookup_tuss_series(df["cd_tuss"]).isna()
+        pending = warm_classification_cache(conn, df.loc[free_text, "ds_receita"].fillna("").astype(str).unique())
+    exams = classify_exams_batch(df["cd_tuss"], df["ds_receita"])
+    save_new_classifications(conn, pending)
+    return exams
+
+def classify_claimed_rows(conn, rows):
+    """
+    Versão sem pandas de classify_records + group_exams_by_tel: classifica
+    cada registro com classify_exams (mesmo cache) e retorna
+    [(tel, client_name, [(exame, ex_type), ...])] para o dispatcher.
+    """
+    texts = {
+        txt or ""
+        for _, _, cd_tuss, ds_receita, *_ in rows
+        for code, txt in zip(cd_tuss, ds_receita)
+        if lookup_tuss(code) is None
+    }
+    pending = warm_classification_cache(conn, texts)
+    grouped = [
+        (tel, client_name, [
+            exam for code, txt in zip(cd_tuss, ds_receita) for exam in classify_exams(code, txt)
+        ])
+        for tel, client_name, cd_tuss, ds_receita, *_ in rows
+    ]
+    save_new_classifications(conn, pending)
+    return grouped
+
+def failure_policy(error):
     """
-    1) Lê 'chunk_size' registros pendentes de cada tabela (WHERE notified=false).
+    (conta_tentativa, adiamento em s) de uma falha de envio na outbox: só erro do
+    destinatário conta tentativa (backoff até o dead-letter); limite diário e
+    erros passageiros (5xx, timeout, 429 esgotado) só adiam, sem esgotar tentativas.
+    """
+    if is_recipient_error(error):
+        return True, 0
+    if is_daily_limit_error(error):
+        return False, OUTBOX_QUOTA_DELAY
+    return False, OUTBOX_TRANSIENT_DELAY
+
+def sent_record_ids(records, tels):
+    """
+    {tabela: [id]} dos registros lidos para os telefones 'tels'. 'records':
+    DataFrame com as colunas tel/src/id ou as linhas de read_claimed_rows.
+    """
+    ids = {tbl: [] for tbl in NOTIFY_TABLES}
+    tels = set(tels)
+    if hasattr(records, "columns"):
+        sent = records[records["tel"].isin(tels)]
+        for src, tbl in enumerate(NOTIFY_TABLES, 1):
+            ids[tbl] = sent.loc[sent["src"] == src, "id"].astype("int64").tolist()
+    else:
+        for row in records:
+            if row.tel in tels:
+                for src, record_id in zip(row.src, row.id):
+                    ids[NOTIFY_TABLES[src - 1]].append(record_id)
+    return ids
+
+def mark_sent(conn, results, errors=None, tenant=None, records=None):
+    """
+    Marca em lote os telefones enviados com sucesso e registra as falhas
+    ('errors' = {tel: erro}) na outbox de reenvio. Com 'records' (os registros
+    lidos, ver sent_record_ids), marca só os registros que entraram na mensagem.
+    Com limite de frequência, registra também o horário dos envios.
+    Retorna quantos telefones foram enviados (0 se nenhum).
+    """
+    if errors:
+        failures = {tel: (err, *failure_policy(err)) for tel, err in errors.items()}
+        statuses = record_send_failures(
+            conn, failures, OUTBOX_MAX_ATTEMPTS, OUTBOX_BASE_DELAY, OUTBOX_MAX_DELAY, OUTBOX_DEAD_RETENTION,
+        )
+        logger.info(f"Falhas registradas na outbox ({len(failures)} telefones): {statuses}")
+        if statuses.get("dead"):
+            logger.warning(f"{statuses['dead']} telefones movidos para dead-letter após {OUTBOX_MAX_ATTEMPTS} tentativas.")
+    sent_tels = [tel for tel, ok in results.items() if ok]
+    if not sent_tels:
+        return 0
+    cap = frequency_cap_for(tenant)
+    ids = None if records is None else sent_record_ids(records, sent_tels)
+    counts = mark_as_notified_by_tels(conn, sent_tels, record_recent=cap is not None, ids=ids)
+    if cap is not None:
+        cap.record(sent_tels)
+    logger.info(f"Marcados como notificados ({len(sent_tels)} telefones): {counts}")
+    return len(sent_tels)
+
+def process_claimed(conn, tels, tenant=None, errors=None):
+    """
+    Lê todos os registros pendentes dos telefones reservados, classifica,
+    envia (com a conta/template do 'tenant', se informado) e marca.
+    Retorna quantas mensagens foram enviadas; 'errors' (dict), se informado,
+    recebe {tel: erro} das falhas.
+    """
+    if USE_PANDAS:
+        with timer("notifier_stage_seconds", stage="read"):
+            df = read_claimed_records(conn, tels)
+        inc("notifier_rows_read_total", len(df))
+        records = df[["tel", "src", "id"]]
+
+        # Classifica o chunk inteiro e agrupa os registros por telefone
+        with timer("notifier_stage_seconds", stage="classify"):
+            notifications = group_exams_by_tel(df, classify_records(conn, df)).itertuples()
+    else:
+        with timer("notifier_stage_seconds", stage="read"):
+            rows = read_claimed_rows(conn, tels)
+        inc("notifier_rows_read_total", sum(len(row[3]) for row in rows))
+        with timer("notifier_stage_seconds", stage="classify"):
+            notifications = classify_claimed_rows(conn, rows)
+        records = rows
+
+    # Envia as notificações em paralelo e marca os telefones enviados como notificados
+    with timer("notifier_stage_seconds", stage="send"):
+        errors = {} if errors is None else errors
+        results = dispatch_notifications(notifications, errors=errors, tenant=tenant)
+    with timer("notifier_stage_seconds", stage="mark"):
+        return mark_sent(conn, results, errors, tenant, records)
+
+def wait_for_work(sleep_seconds):
+    """
+    Espera até o próximo ciclo:
+    - USE_LISTEN_NOTIFY: bloqueia no LISTEN até um INSERT (ou LISTEN_FALLBACK_SECONDS).
+    - Caso contrário: dorme 'sleep_seconds'.
+    """
+    if USE_LISTEN_NOTIFY:
+        if wait_for_inserts(LISTEN_FALLBACK_SECONDS):
+            logger.info("Novos registros recebidos (NOTIFY).")
+        else:
+            logger.info(f"Sem NOTIFY em {LISTEN_FALLBACK_SECONDS}s. Varredura de segurança.")
+    else:
+        time.sleep(sleep_seconds)
+
+def run_cycle(chunk_size, tenant=None, max_tels=None):
+    """
+    Executa um ciclo: reserva, processa e libera um lote de telefones.
+    - 'tenant': usa o banco e a conta da clínica em vez dos globais.
+    - 'max_tels': reserva no máximo esse número de telefones (o excedente é liberado).
+    - As reservas são renovadas (LeaseHeartbeat) enquanto o ciclo durar, mesmo
+      que o envio passe de LEASE_SECONDS.
+    Retorna (telefones reservados, mensagens enviadas).
+    """
+    scope = "Produção" if tenant is None else f"Produção/{tenant.name}"
+    logger.info(f"Iniciando varredura de dados não notificados ({scope}, chunk_size={chunk_size}).")
+    sent = 0
+    db = get_engine() if tenant is None else tenant.engine
+    with timer("notifier_stage_seconds", stage="cycle"), db.connect() as conn:
+        claimed = claim_pending_tels(conn, WORKER_ID, chunk_size, LEASE_SECONDS)
+        if max_tels is not None and len(claimed) > max_tels:
+            release_claims(conn, WORKER_ID, claimed[max_tels:])
+            claimed = claimed[:max_tels]
+        if claimed:
+            try:
+                with LeaseHeartbeat(db, claimed):
+                    allowed = apply_frequency_cap(conn, claimed, tenant)
+                    if allowed:
+                        sent = process_claimed(conn, allowed, tenant)
+            finally:
+                release_claims(conn, WORKER_ID, claimed)
+    inc("notifier_cycles_total")
+    return claimed, sent
+
+def infinite_loop(chunk_size=CHUNK_SIZE, sleep_seconds=SLEEP_SECONDS):
+    """
+    1) Reserva os telefones de até 'chunk_size' registros pendentes de cada tabela
+       (WHERE notified=false) e lê todos os registros pendentes desses telefones.
+       Várias réplicas podem rodar juntas: cada uma processa telefones distintos.
     2) Agrupa por telefone, classifica e deduplica os exames.
     3) Envia 1 mensagem por telefone com todos os exames pendentes e marca os registros como notified.
-    4) Dorme e repete.
+    4) Dorme (ou espera um NOTIFY, se USE_LISTEN_NOTIFY) e repete.
+    Com ADAPTIVE_CHUNKING, chunk_size e a pausa entre ciclos são recalculados a cada
+    ciclo pelo AdaptiveController (duração, backlog estimado, limite do provedor e memória).
     """
+    controller = AdaptiveController(chunk_size, sleep_seconds) if ADAPTIVE_CHUNKING else None
     while True:
-        logger.info("Iniciando varredura de dados não notificados (Produção, chunk_size=%d).", chunk_size)
-        any_sent = False
-
-        with engine.connect() as conn:
-            # Leitura dos dados das tabelas
-            df1 = pd.read_sql(
-                text(
-                    "SELECT id, solicitante, tel, ds_receita, cd_tuss "
-                    "FROM public.dados_estruturados "
-                    "WHERE NOT notified "
-                    "ORDER BY id LIMIT :lim"
-                ),
-                conn,
-                params={"lim": chunk_size}
-            )
-            df2 = pd.read_sql(
-                text(
-                    "SELECT id, solicitante, tel, ds_receita "
-                    "FROM public.dados_nao_estruturados "
-                    "WHERE NOT notified "
-                    "ORDER BY id LIMIT :lim"
-                ),
-                conn,
-                params={"lim": chunk_size}
-            )
-
-            if df1.empty and df2.empty:
-                logger.info("Nenhum registro pendente encontrado. Dormindo...")
-                time.sleep(sleep_seconds)
-                continue
-
-            df = pd.concat([df1, df2], ignore_index=True)
-
-            # Agrupa os registros por telefone
-            grouped = {}
-            for _, row in df.iterrows():
-                cd_tuss = row.get("cd_tuss")
-                ds_receita = row.get("ds_receita", "")
-                tel = row["tel"]
-                solicitante = row["solicitante"]
-
-                exame, ex_type = classify_exam(cd_tuss, ds_receita)
-                if tel not in grouped:
-                    grouped[tel] = {"client_name": solicitante, "exams": []}
-                grouped[tel]["exams"].append((exame, ex_type))
-
-            # Envia notificação para cada telefone e marca os registros como notificados
-            for tel, info in grouped.items():
-                c_name = info["client_name"]
-                exam_list = info["exams"]
-                ok = send_notification(tel, c_name, exam_list)
-                if ok:
-                    any_sent = True
-                    mark_as_notified_by_tel(conn, tel)
-
-        if any_sent:
+        started = time.perf_counter()
+        claimed, any_sent = run_cycle(chunk_size)
+        elapsed = time.perf_counter() - started
+
+        if controller is not None and claimed:
+            with get_engine().connect() as conn:
+                backlog = estimate_pending_rows(conn)
+            chunk_size, delay = controller.update(elapsed, len(claimed), backlog)
+            set_gauge("notifier_chunk_size", chunk_size)
+            set_gauge("notifier_pending_estimate", backlog)
+            if delay > 0:
+                logger.info(f"Backlog estimado em {backlog} registros. Retomando em {delay:.0f}s.")
+                wait_for_work(delay)
+            continue
+
+        if not claimed:
+            logger.info("Nenhum registro pendente encontrado. Aguardando...")
+            wait_for_work(sleep_seconds)
+        elif any_sent and USE_LISTEN_NOTIFY:
+            # Sem pausa fixa: se o backlog acabou, o próximo ciclo espera no LISTEN.
+            continue
+        elif any_sent:
             logger.info("Envios realizados neste ciclo. Retomando em 5s.")
             time.sleep(5)
         else:
-            logger.info(f"Nenhum envio realizado neste ciclo. Dormindo {sleep_seconds}s.")
-            time.sleep(sleep_seconds)
+            logger.info(f"Nenhum envio realizado neste ciclo. Aguardando {sleep_seconds}s.")
+            wait_for_work(sleep_seconds)
+
+def run_once(chunk_size=CHUNK_SIZE):
+    """
+    Processa o backlog até não haver telefone a reservar e retorna (ciclos,
+    telefones, mensagens enviadas). Para execuções agendadas (Cloud Run Jobs,
+    Cloud Scheduler): sem pausas nem LISTEN. Falhas de envio vão para a outbox
+    com reenvio futuro, então não são reservadas de novo nesta execução.
+    """
+    cycles = tels = sent = 0
+    while True:
+        claimed, cycle_sent = run_cycle(chunk_size)
+        if not claimed:
+            break
+        cycles += 1
+        tels += len(claimed)
+        sent += cycle_sent
+    logger.info(f"Backlog processado: {cycles} ciclos, {tels} telefones, {sent} mensagens enviadas.")
+    return cycles, tels, sent
 
-def main():
+def main(once=False):
     logger.info("Iniciando Envio de Notificações.")
-    infinite_loop(chunk_size=1000, sleep_seconds=30)
+    start_metrics_server(METRICS_PORT)
+    if TENANTS_FILE:
+        from application.tenants import load_tenants, run_tenants  # Import local: só o modo multi-tenant
+        run_tenants(load_tenants(TENANTS_FILE), sleep_seconds=SLEEP_SECONDS, once=once)
+        logger.info("Script finalizado.")
+        return
+    listen = USE_LISTEN_NOTIFY and not once
+    with get_engine().connect() as conn:
+        ensure_service_tables(conn)
+        if SCHEMA_CHECK:
+            check_query_plans(conn, NOTIFY_TABLES)
+        if listen:
+            ensure_notify_triggers(conn)
+    if listen:
+        listen_for_inserts()
+    if PRIORITY_SCHEDULING:
+        from application.priority import PriorityScheduler, run_priority  # Import local: só com PRIORITY_SCHEDULING
+        run_priority(PriorityScheduler(), chunk_size=CHUNK_SIZE, sleep_seconds=SLEEP_SECONDS, once=once)
+    elif once:
+        run_once(chunk_size=CHUNK_SIZE)
+    elif USE_PIPELINE:
+        from application.pipeline import run_pipeline  # Import local para evitar dependência circular
+        run_pipeline(chunk_size=CHUNK_SIZE, sleep_seconds=SLEEP_SECONDS)
+    else:
+        infinite_loop(chunk_size=CHUNK_SIZE, sleep_seconds=SLEEP_SECONDS)
     logger.info("Script finalizado.")
@@ -0,0 +1,196 @@
+import queue
+import signal
+import logging
+import threading
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from config.settings import (
+    WORKER_ID, LEASE_SECONDS, USE_LISTEN_NOTIFY, LISTEN_FALLBACK_SECONDS,
+    PIPELINE_QUEUE_SIZE, CLASSIFY_PROCESSES,
+)
+from infrastructure.database import get_engine, claim_pending_tels, release_claims, wait_for_inserts
+from infrastructure.dispatcher import dispatch_notifications
+from infrastructure.leases import LeaseHeartbeat
+from domain.exam_utils import classify_exams_batch
+from application.notification_service import read_claimed_records, group_exams_by_tel, mark_sent, apply_frequency_cap
+from infrastructure.metrics import inc, timer, set_gauge
+
+logger = logging.getLogger("notifier")
+
+_STOP = object()  # Sentinela: encerra o estágio seguinte depois de drenar a fila
+
+def _init_classify_worker():
+    """Processos do pool não herdam os handlers de parada: quem coordena é o processo pai."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+class Pipeline:
+    """
+    Motor em estágios com filas limitadas entre eles, para que o chunk N+1
+    seja lido e classificado enquanto o chunk N é enviado:
+
+        leitura -> [classify] -> classificação (pool de processos) -> [send]
+                -> envio (dispatcher) -> [write] -> marcação + liberação das reservas
+
+    - Backpressure: put() bloqueia quando a fila seguinte está cheia.
+    - Reservas: um chunk pode esperar nas filas mais que LEASE_SECONDS, então
+      um LeaseHeartbeat renova as reservas de todos os chunks em andamento
+      (da reserva até a liberação) e o envio descarta telefones cuja reserva
+      tenha sido perdida mesmo assim.
+    - request_stop() (SIGTERM/SIGINT) para a leitura; os demais estágios
+      drenam o que já está em andamento e encerram em ordem.
+    - queue_depths() expõe a profundidade de cada fila para ajuste fino.
+    """
+
+    def __init__(self, chunk_size=1000, sleep_seconds=30,
+                 queue_size=PIPELINE_QUEUE_SIZE, classify_processes=CLASSIFY_PROCESSES):
+        self.chunk_size = chunk_size
+        self.sleep_seconds = sleep_seconds
+        self.classify_processes = max(1, classify_processes)
+        self.queues = {name: queue.Queue(maxsize=queue_size) for name in ("classify", "send", "write")}
+        self.stop_event = threading.Event()
+        self.leases = LeaseHeartbeat(get_engine())
+
+    def queue_depths(self):
+        depths = {name: q.qsize() for name, q in self.queues.items()}
+        for name, depth in depths.items():
+            set_gauge("notifier_pipeline_queue_depth", depth, queue=name)
+        return depths
+
+    def request_stop(self, *_):
+        if not self.stop_event.is_set():
+            logger.info("Pipeline: parada solicitada, drenando trabalho em andamento.")
+        self.stop_event.set()
+
+    def run(self):
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.request_stop)
+            signal.signal(signal.SIGINT, self.request_stop)
+
+        pool = ProcessPoolExecutor(max_workers=self.classify_processes, initializer=_init_classify_worker)
+        with self.leases, pool:
+            self.pool = pool
+            stages = [
+                threading.Thread(target=target, name=f"pipeline-{target.__name__.strip('_')}")
+                for target in (self._reader, self._classifier, self._sender, self._writer)
+            ]
+            for t in stages:
+                t.start()
+            for t in stages:
+                t.join()
+        logger.info("Pipeline encerrado.")
+
+    def _idle_wait(self):
+        """Espera por trabalho novo sem impedir a parada (acorda a cada 1s)."""
+        timeout = LISTEN_FALLBACK_SECONDS if USE_LISTEN_NOTIFY else self.sleep_seconds
+        for _ in range(max(1, int(timeout))):
+            if self.stop_event.is_set():
+                return
+            if USE_LISTEN_NOTIFY:
+                if wait_for_inserts(1):
+                    return
+            else:
+                self.stop_event.wait(1)
+
+    def _reader(self):
+        """Reserva telefones e lê seus registros pendentes."""
+        try:
+            with get_engine().connect() as conn:
+                while not self.stop_event.is_set():
+                    claimed = []
+                    try:
+                        claimed = claim_pending_tels(conn, WORKER_ID, self.chunk_size, LEASE_SECONDS)
+                        if not claimed:
+                            logger.info(f"Pipeline: nenhum registro pendente. Filas: {self.queue_depths()}")
+                            self._idle_wait()
+                            continue
+                        self.leases.track(claimed)
+                        allowed = apply_frequency_cap(conn, claimed)
+                        if not allowed:
+                            release_claims(conn, WORKER_ID, claimed)
+                            self.leases.untrack(claimed)
+                            continue
+                        with timer("notifier_stage_seconds", stage="read"):
+                            df = read_claimed_records(conn, allowed)
+                            conn.commit()
+                        inc("notifier_rows_read_total", len(df))
+                    except Exception:
+                        logger.exception("Pipeline: erro na leitura.")
+                        conn.rollback()
+                        self.leases.untrack(claimed)  # reservas expiram em LEASE_SECONDS
+                        self.stop_event.wait(self.sleep_seconds)
+                        continue
+                    logger.info(f"Pipeline: {len(df)} registros de {len(claimed)} telefones lidos. "
+                                f"Filas: {self.queue_depths()}")
+                    self.queues["classify"].put((claimed, df))
+        finally:
+            self.queues["classify"].put(_STOP)
+
+    def _classifier(self):
+        """Classifica o chunk em fatias paralelas no pool de processos e agrupa por telefone."""
+        while (item := self.queues["classify"].get()) is not _STOP:
+            claimed, df = item
+            grouped = None
+            try:
+                with timer("notifier_stage_seconds", stage="classify"):
+                    size = -(-len(df) // self.classify_processes) or 1
+                    futures = [
+                        self.pool.submit(classify_exams_batch, part["cd_tuss"], part["ds_receita"])
+                        for part in (df.iloc[i:i + size] for i in range(0, len(df), size))
+                    ]
+                    exams = pd.concat([f.result() for f in futures]) if futures else classify_exams_batch(
+                        df["cd_tuss"], df["ds_receita"])
+                    grouped = group_exams_by_tel(df, exams)
+            except Exception:
+                logger.exception("Pipeline: erro na classificação.")
+            self.queues["send"].put((claimed, grouped, df[["tel", "src", "id"]]))
+        self.queues["send"].put(_STOP)
+
+    def _sender(self):
+        """Envia as mensagens do chunk (dispatcher concorrente), só para telefones ainda reservados."""
+        while (item := self.queues["send"].get()) is not _STOP:
+            claimed, grouped, records = item
+            results, errors = {}, {}
+            if grouped is not None:
+                held = grouped.index.isin(self.leases.held(grouped.index))
+                if not held.all():
+                    logger.warning(f"Pipeline: {(~held).sum()} telefones com reserva perdida removidos do chunk.")
+                    grouped = grouped[held]
+                try:
+                    with timer("notifier_stage_seconds", stage="send"):
+                        results = dispatch_notifications(grouped.itertuples(), errors=errors)
+                except Exception:
+                    logger.exception("Pipeline: erro no envio.")
+            self.queues["write"].put((claimed, results, errors, records))
+        self.queues["write"].put(_STOP)
+
+    def _writer(self):
+        """Marca os enviados e libera as reservas, agrupando os chunks que estiverem na fila."""
+        with get_engine().connect() as conn:
+            stop = False
+            while not stop:
+                batch = [self.queues["write"].get()]
+                while True:
+                    try:
+                        batch.append(self.queues["write"].get_nowait())
+                    except queue.Empty:
+                        break
+                stop = _STOP in batch
+                batch = [item for item in batch if item is not _STOP]
+                if not batch:
+                    continue
+                claimed = [tel for tels, _, _, _ in batch for tel in tels]
+                results = {tel: ok for _, res, _, _ in batch for tel, ok in res.items()}
+                errors = {tel: err for _, _, errs, _ in batch for tel, err in errs.items()}
+                records = pd.concat([recs for _, _, _, recs in batch], ignore_index=True)
+                try:
+                    with timer("notifier_stage_seconds", stage="mark"):
+                        mark_sent(conn, results, errors, records=records)
+                        release_claims(conn, WORKER_ID, claimed)
+                except Exception:
+                    logger.exception("Pipeline: erro na marcação (reservas expiram em LEASE_SECONDS).")
+                    conn.rollback()
+                self.leases.untrack(claimed)
+
+def run_pipeline(chunk_size=1000, sleep_seconds=30):
+    Pipeline(chunk_size, sleep_seconds).run()
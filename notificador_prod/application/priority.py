@@ -0,0 +1,309 @@
+import math
+import time
+import heapq
+import logging
+from datetime import date, datetime
+from itertools import count
+from sqlalchemy import text
+from config.settings import (
+    WORKER_ID, LEASE_SECONDS, DAILY_SEND_LIMIT, SEND_WINDOW_START, SEND_WINDOW_END, PRIORITY_CANDIDATES,
+    PRIORITY_SCAN_ROWS, PRIORITY_WEIGHT_IMAGEM, PRIORITY_WEIGHT_EXAM, PRIORITY_WEIGHT_AGE_DAY,
+)
+from infrastructure.database import (
+    get_engine, claim_tels, release_claims, scan_pending_tels, outbox_released_since,
+    daily_sends, reserve_daily_sends, release_daily_sends,
+)
+from infrastructure.twilio_client import is_daily_limit_error
+from infrastructure.leases import LeaseHeartbeat
+from infrastructure.metrics import inc, set_gauge
+from domain.exam_utils import IGNORE_TERMS, classify_exams
+from application.notification_service import process_claimed, wait_for_work, apply_frequency_cap
+
+logger = logging.getLogger("notifier")
+
+# Dados para pontuar os telefones: prescrição mais antiga (DATA) e os registros pendentes
+CANDIDATES_SQL = text(
+    "SELECT tel, min(data) AS data, "
+    "array_agg(cd_tuss ORDER BY src, id) AS cd_tuss, "
+    "array_agg(ds_receita ORDER BY src, id) AS ds_receita "
+    "FROM ("
+    "SELECT 1 AS src, id, tel, CAST(data AS text) AS data, cd_tuss, ds_receita "
+    "FROM public.dados_estruturados "
+    "WHERE NOT notified AND tel = ANY(:tels) "
+    "UNION ALL "
+    "SELECT 2, id, tel, CAST(data AS text), NULL, ds_receita "
+    "FROM public.dados_nao_estruturados "
+    "WHERE NOT notified AND tel = ANY(:tels)"
+    ") r "
+    "GROUP BY tel"
+)
+
+def prescription_age_days(value, today):
+    """Dias desde a data da prescrição (texto ISO 'AAAA-MM-DD...'); 0 se ausente ou inválida."""
+    try:
+        return max(0, (today - date.fromisoformat(str(value)[:10])).days)
+    except (TypeError, ValueError):
+        return 0
+
+class PriorityScheduler:
+    """
+    Decide quem recebe a cota diária do provedor (DAILY_SEND_LIMIT):
+    1) Pontua cada telefone: PRIORITY_WEIGHT_IMAGEM se algum exame é de imagem,
+       + PRIORITY_WEIGHT_EXAM por exame pendente, + PRIORITY_WEIGHT_AGE_DAY por
+       dia desde a prescrição mais antiga (negativo: receitas recentes primeiro).
+       O peso da idade é linear, então a ordem entre candidatos não muda com o tempo.
+    2) Mantém só os melhores candidatos em um heap (no máximo a cota restante
+       do dia, até PRIORITY_CANDIDATES). A varredura é incremental por id: a
+       primeira do dia lê o backlog uma vez; depois cada ciclo só lê registros
+       novos. Nova varredura só quando o heap esvazia e algum telefone ficou de
+       fora (descartado do heap, reservado por outra réplica, com falha ou
+       adiado pelo limite de frequência) ou saiu da outbox depois do início
+       da varredura.
+    3) Distribui a cota na janela SEND_WINDOW_START..SEND_WINDOW_END (horas,
+       no mesmo dia; janela inválida é recusada na criação): até o instante t,
+       no máximo a fração decorrida da janela x DAILY_SEND_LIMIT.
+    4) O erro 63038 (limite diário da conta) zera a cota até o dia seguinte.
+    A contagem do dia fica no banco (notification_daily_sends), compartilhada
+    entre réplicas: cada ciclo reserva a sua parte da cota antes de enviar e
+    devolve o que não usou.
+    Sem DAILY_SEND_LIMIT só a ordem de envio muda: o heap não descarta ninguém,
+    a varredura para quando ele enche e continua dos cursores quando esvazia
+    (prioridade dentro de cada janela de PRIORITY_CANDIDATES telefones).
+    """
+
+    def __init__(self, daily_limit=DAILY_SEND_LIMIT, window_start=SEND_WINDOW_START, window_end=SEND_WINDOW_END,
+                 max_candidates=PRIORITY_CANDIDATES, scan_rows=PRIORITY_SCAN_ROWS,
+                 weight_imagem=PRIORITY_WEIGHT_IMAGEM, weight_exam=PRIORITY_WEIGHT_EXAM,
+                 weight_age_day=PRIORITY_WEIGHT_AGE_DAY):
+        if not 0 <= window_start < window_end <= 24:
+            # A cota do provedor é por dia: uma janela que cruza a meia-noite dividiria a cota entre dois dias
+            raise ValueError(f"Janela de envio inválida: SEND_WINDOW_START={window_start}, "
+                             f"SEND_WINDOW_END={window_end} (use 0 <= início < fim <= 24, sem cruzar a meia-noite).")
+        self.daily_limit = daily_limit
+        self.window_start = window_start
+        self.window_end = window_end
+        self.max_candidates = max_candidates
+        self.scan_rows = scan_rows
+        self.weight_imagem = weight_imagem
+        self.weight_exam = weight_exam
+        self.weight_age_day = weight_age_day
+        self._seq = count()
+        self._day = None
+        self._roll_day(date.today())
+
+    def _roll_day(self, today):
+        """Novo dia: zera a contagem e recomeça a varredura (ranking com a cota nova)."""
+        self._day = today
+        self.sent_today = 0
+        self.exhausted = False
+        self._reset_sweep()
+
+    def _reset_sweep(self):
+        self._heap = []  # (-pontuação, seq, tel): o topo é o melhor candidato
+        self._members = set()
+        self._cursors = {}
+        self._sweep_started = time.time()
+        self._swept = False  # varredura chegou ao fim das tabelas
+        self._stale = False  # algum telefone ficou de fora do heap nesta varredura
+
+    def _check_day(self, now):
+        if now.date() != self._day:
+            logger.info(f"Novo dia: {self.sent_today} mensagens enviadas em {self._day}. Cota renovada.")
+            self._roll_day(now.date())
+
+    def sync(self, conn, now=None):
+        """Atualiza a contagem do dia com os envios de todas as réplicas."""
+        self._check_day(now or datetime.now())
+        self.sent_today, exhausted = daily_sends(conn, self._day)
+        self.exhausted = self.exhausted or exhausted
+
+    def remaining_today(self):
+        """Mensagens ainda permitidas hoje (None = sem limite diário)."""
+        if self.exhausted:
+            return 0
+        if self.daily_limit is None:
+            return None
+        return max(0, self.daily_limit - self.sent_today)
+
+    def budget(self, now=None):
+        """
+        Mensagens permitidas agora pelo ritmo da janela (None = sem limite):
+        ceil(DAILY_SEND_LIMIT x fração decorrida da janela) - enviadas hoje.
+        """
+        now = now or datetime.now()
+        self._check_day(now)
+        remaining = self.remaining_today()
+        if remaining is None or remaining == 0:
+            return remaining
+        return min(remaining, max(0, self.paced_total(now) - self.sent_today))
+
+    def paced_total(self, now):
+        """Total de envios do dia liberado pelo ritmo até 'now': ceil(DAILY_SEND_LIMIT x fração decorrida)."""
+        hour = now.hour + now.minute / 60 + now.second / 3600
+        if not self.window_start <= hour < self.window_end:
+            return 0
+        elapsed = (hour - self.window_start) / (self.window_end - self.window_start)
+        return math.ceil(self.daily_limit * elapsed)
+
+    def seconds_until_budget(self, now=None):
+        """Segundos até a próxima mensagem liberada pelo ritmo (ou até a janela/dia seguinte)."""
+        now = now or datetime.now()
+        hour = now.hour + now.minute / 60 + now.second / 3600
+        if self.remaining_today() == 0 or hour >= self.window_end:
+            return (24 - hour + self.window_start) * 3600
+        if hour < self.window_start:
+            return (self.window_start - hour) * 3600
+        per_message = (self.window_end - self.window_start) * 3600 / self.daily_limit
+        next_hour = self.window_start + (self.sent_today + 1) * per_message / 3600
+        return max(1.0, (next_hour - hour) * 3600)
+
+    def capacity(self):
+        """Tamanho do heap: não adianta guardar mais candidatos do que a cota restante do dia."""
+        remaining = self.remaining_today()
+        return self.max_candidates if remaining is None else min(self.max_candidates, remaining)
+
+    def score(self, exams, data, today):
+        """Pontuação de um telefone a partir dos seus exames [(exame, ex_type)] e da data mais antiga."""
+        names = {exame for exame, _ in exams if exame.lower() not in IGNORE_TERMS}
+        imagem = any(ex_type == "imagem" for _, ex_type in exams)
+        return (self.weight_imagem * imagem + self.weight_exam * len(names)
+                + self.weight_age_day * prescription_age_days(data, today))
+
+    def refill(self, conn):
+        """
+        Lê os registros novos (cursor por tabela), pontua os telefones ainda
+        fora do heap e descarta os piores além de capacity().
+        Retorna quantos telefones novos foram pontuados.
+        """
+        if self._swept and not self._heap and (self._stale or outbox_released_since(conn, self._sweep_started)):
+            logger.info("Heap de prioridade vazio: nova varredura do backlog.")
+            self._reset_sweep()
+        scored = 0
+        while True:
+            if self.daily_limit is None and len(self._heap) >= self.max_candidates:
+                break  # Sem cota: o resto do backlog é lido dos cursores quando o heap esvaziar
+            tels, self._cursors, done = scan_pending_tels(conn, self._cursors, self.scan_rows)
+            tels = [tel for tel in tels if tel not in self._members]
+            if tels:
+                rows = conn.execute(CANDIDATES_SQL, {"tels": tels}).all()
+                conn.commit()
+                today = self._day
+                for tel, data, cd_tuss, ds_receita in rows:
+                    exams = [exam for code, txt in zip(cd_tuss, ds_receita) for exam in classify_exams(code, txt)]
+                    heapq.heappush(self._heap, (-self.score(exams, data, today), next(self._seq), tel))
+                    self._members.add(tel)
+                scored += len(rows)
+                if self.daily_limit is not None:
+                    self._trim()
+            if done:
+                self._swept = True
+                break
+        set_gauge("notifier_priority_candidates", len(self._heap))
+        return scored
+
+    def _trim(self):
+        limit = self.capacity()
+        if len(self._heap) > limit:
+            self._heap = heapq.nsmallest(limit, self._heap)
+            heapq.heapify(self._heap)
+            self._members = {tel for _, _, tel in self._heap}
+            self._stale = True
+
+    def reserve(self, conn, n, now, once=False):
+        """
+        Reserva no banco até 'n' envios (limitados aos candidatos no heap) sem
+        passar do ritmo da janela ('once': da cota do dia). Retorna quantos.
+        """
+        wanted = min(n, len(self._heap))
+        if wanted == 0:
+            return 0
+        cap = None if self.daily_limit is None else self.daily_limit if once else self.paced_total(now)
+        reserved, self.sent_today, exhausted = reserve_daily_sends(conn, self._day, wanted, cap)
+        self.exhausted = self.exhausted or exhausted
+        return reserved
+
+    def has_candidates(self):
+        return bool(self._heap)
+
+    def take(self, n):
+        """Retira os até 'n' telefones de maior pontuação."""
+        tels = []
+        while self._heap and len(tels) < n:
+            tel = heapq.heappop(self._heap)[2]
+            self._members.discard(tel)
+            tels.append(tel)
+        return tels
+
+    def record(self, conn, reserved, taken, claimed, sendable, sent, errors):
+        """
+        Contabiliza o ciclo: devolve ao banco a parte da reserva não enviada;
+        telefones não reservados, adiados pelo limite de frequência ('sendable'
+        menor que 'claimed') ou com falha entram na próxima varredura.
+        """
+        limit_hit = any(is_daily_limit_error(err) for err in errors.values())
+        self.sent_today, self.exhausted = release_daily_sends(
+            conn, self._day, reserved - sent, self.exhausted or limit_hit)
+        if len(claimed) < len(taken) or len(sendable) < len(claimed) or errors:
+            self._stale = True
+        if limit_hit:
+            logger.warning(f"Limite diário do provedor atingido após {self.sent_today} envios hoje. "
+                           "Envios retomados no dia seguinte.")
+        remaining = self.remaining_today()
+        if remaining is not None:
+            set_gauge("notifier_daily_budget_remaining", remaining)
+
+def run_priority(scheduler, chunk_size, sleep_seconds, once=False):
+    """
+    Loop do escalonador por prioridade (PRIORITY_SCHEDULING):
+    1) Calcula quantas mensagens o ritmo do dia libera agora (até 'chunk_size'),
+       com os envios de todas as réplicas; sem cota, espera a próxima liberação.
+    2) Atualiza o heap com os registros novos, reserva a cota no banco e
+       retira os melhores telefones.
+    3) Reserva, envia e marca esses telefones (process_claimed) e devolve a
+       cota não usada.
+    'once': processa enquanto houver candidatos e cota restante no dia, sem
+    esperar pelo ritmo da janela.
+    """
+    engine = get_engine()
+    while True:
+        now = datetime.now()
+        with engine.connect() as conn:
+            scheduler.sync(conn, now)
+        allowed = scheduler.budget(now)
+        if once:
+            allowed = scheduler.remaining_today()
+        if allowed == 0:
+            if once:
+                logger.info("Cota diária esgotada. Encerrando.")
+                break
+            delay = min(sleep_seconds, scheduler.seconds_until_budget(now))
+            logger.info(f"Cota do momento usada ({scheduler.sent_today} envios hoje). Retomando em {delay:.0f}s.")
+            time.sleep(delay)
+            continue
+
+        limit = chunk_size if allowed is None else min(chunk_size, allowed)
+        with engine.connect() as conn:
+            scored = scheduler.refill(conn)
+            if not scheduler.has_candidates():
+                if once:
+                    break
+                logger.info("Nenhum registro pendente encontrado. Aguardando...")
+                wait_for_work(sleep_seconds)
+                continue
+            reserved = scheduler.reserve(conn, limit, now, once)
+            tels = scheduler.take(reserved)
+            if not tels:
+                continue  # Outra réplica usou a cota do momento
+            claimed = claim_tels(conn, WORKER_ID, tels, LEASE_SECONDS)
+            errors, sent, sendable = {}, 0, []
+            try:
+                with LeaseHeartbeat(engine, claimed):
+                    sendable = apply_frequency_cap(conn, claimed)
+                    if sendable:
+                        sent = process_claimed(conn, sendable, errors=errors)
+            finally:
+                release_claims(conn, WORKER_ID, claimed)
+            scheduler.record(conn, reserved, tels, claimed, sendable, sent, errors)
+        inc("notifier_cycles_total")
+        logger.info(f"Prioridade: {scored} telefones pontuados, {sent}/{len(tels)} enviados "
+                    f"({scheduler.sent_today} hoje, cota restante {scheduler.remaining_today()}).")
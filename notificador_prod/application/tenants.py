@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from datetime import date
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config.settings import (
+    COMPANY_NAME, PLATFORM_LINK, TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER, USE_SANDBOX,
+    TWILIO_RATE_LIMIT, CHUNK_SIZE, MESSAGE_TEMPLATE_FILE, TENANT_WORKERS, TENANT_POOL_SIZE,
+    SCHEMA_CHECK, FREQUENCY_CAP_SECONDS,
+)
+from infrastructure.database import NOTIFY_TABLES, create_db_engine, ensure_service_tables
+from infrastructure.schema import check_query_plans
+from infrastructure.rate_limiter import TokenBucket
+from infrastructure.twilio_client import create_client
+from infrastructure.metrics import inc
+from domain.message_templates import load_template
+from application.notification_service import run_cycle
+from application.frequency_cap import FrequencyCap
+
+logger = logging.getLogger("notifier")
+
+class Tenant:
+    """
+    Uma clínica atendida pelo processo:
+    1) Banco próprio (engine com no máximo 'pool_size' conexões).
+    2) Template, conta Twilio e número de origem próprios.
+    3) Cotas próprias: 'rate_limit' (mensagens/s), 'daily_limit' (mensagens/dia, opcional)
+       e 'frequency_cap_seconds' (intervalo mínimo entre mensagens ao mesmo telefone).
+    Campos omitidos no arquivo usam as variáveis de ambiente globais.
+    """
+
+    def __init__(self, name, database_url, company_name=COMPANY_NAME, platform_link=PLATFORM_LINK,
+                 twilio_account_sid=TWILIO_ACCOUNT_SID, twilio_auth_token=TWILIO_AUTH_TOKEN,
+                 from_number=TWILIO_FROM_NUMBER, use_sandbox=USE_SANDBOX, rate_limit=TWILIO_RATE_LIMIT,
+                 daily_limit=None, chunk_size=CHUNK_SIZE, message_template_file=MESSAGE_TEMPLATE_FILE,
+                 pool_size=TENANT_POOL_SIZE, frequency_cap_seconds=FREQUENCY_CAP_SECONDS):
+        self.name = name
+        self.engine = create_db_engine(database_url, pool_size)
+        self.template = load_template(message_template_file, company_name=company_name, platform_link=platform_link)
+        self.twilio_account_sid = twilio_account_sid
+        self.twilio_auth_token = twilio_auth_token
+        self.from_number = from_number
+        self.use_sandbox = use_sandbox
+        self.rate_limiter = TokenBucket(rate_limit)
+        self.chunk_size = chunk_size
+        self.daily_limit = daily_limit
+        self.frequency_cap = FrequencyCap(frequency_cap_seconds) if frequency_cap_seconds > 0 else None
+        self._client = None
+        self._lock = threading.Lock()
+        self._day = date.today()
+        self._sent_today = 0
+
+    def twilio_client(self):
+        """Client do Twilio da clínica (criado no primeiro envio)."""
+        with self._lock:
+            if self._client is None:
+                self._client = create_client(self.twilio_account_sid, self.twilio_auth_token)
+            return self._client
+
+    def remaining_today(self):
+        """Mensagens ainda permitidas hoje (None = sem limite diário)."""
+        if self.daily_limit is None:
+            return None
+        with self._lock:
+            if self._day != date.today():
+                self._day, self._sent_today = date.today(), 0
+            return max(0, self.daily_limit - self._sent_today)
+
+    def record_sent(self, sent):
+        """Soma os envios do ciclo à cota do dia."""
+        with self._lock:
+            self._sent_today += sent
+
+def _parse_bool(value):
+    """Booleano do JSON ou texto expandido ("true"/"false", como nas variáveis de ambiente)."""
+    return value.strip().lower() == "true" if isinstance(value, str) else bool(value)
+
+# Campos não-texto de Tenant: ${VARIAVEL} chega como texto e é convertido aqui
+FIELD_TYPES = {
+    "use_sandbox": _parse_bool,
+    "rate_limit": float,
+    "daily_limit": int,
+    "chunk_size": int,
+    "pool_size": int,
+    "frequency_cap_seconds": int,
+}
+
+def _tenant_fields(entry):
+    """Expande ${VARIAVEL} nos valores texto e converte os campos numéricos e booleanos."""
+    fields = {}
+    for key, value in entry.items():
+        if isinstance(value, str):
+            value = os.path.expandvars(value)
+        if key in FIELD_TYPES and value is not None:
+            try:
+                value = FIELD_TYPES[key](value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Tenant {entry.get('name')!r}: valor inválido para {key}: {value!r}") from None
+        fields[key] = value
+    return fields
+
+def load_tenants(path):
+    """
+    Lê o registro de tenants (JSON: lista de objetos com os campos de Tenant).
+    Valores texto aceitam ${VARIAVEL} para não gravar segredos no arquivo;
+    campos numéricos e booleanos são convertidos depois da expansão.
+    """
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = []
+    for entry in entries:
+        tenants.append(Tenant(**_tenant_fields(entry)))
+    names = [t.name for t in tenants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Nomes de tenant duplicados em {path}: {names}")
+    logger.info(f"{len(tenants)} tenants carregados de {path}: {', '.join(names)}")
+    return tenants
+
+def run_tenant_cycle(tenant, sleep_seconds):
+    """
+    Executa um ciclo do tenant respeitando a cota diária. Retorna (pausa em s
+    até o próximo ciclo dele, ocioso): ocioso se não havia o que enviar, a cota
+    acabou ou o ciclo falhou. Erros de um tenant não afetam os demais.
+    """
+    remaining = tenant.remaining_today()
+    if remaining == 0:
+        logger.info(f"Tenant {tenant.name}: limite diário ({tenant.daily_limit}) atingido.")
+        return sleep_seconds, True
+    try:
+        claimed, sent = run_cycle(tenant.chunk_size, tenant=tenant, max_tels=remaining)
+    except Exception:
+        logger.exception(f"Tenant {tenant.name}: erro no ciclo. Nova tentativa em {sleep_seconds}s.")
+        inc("notifier_tenant_errors_total", tenant=tenant.name)
+        return sleep_seconds, True
+    tenant.record_sent(sent)
+    if not claimed:
+        logger.info(f"Tenant {tenant.name}: nenhum registro pendente.")
+        return sleep_seconds, True
+    return (5 if sent else sleep_seconds), False
+
+def run_tenants(tenants, sleep_seconds=30, workers=TENANT_WORKERS, once=False):
+    """
+    Escalonador justo entre tenants:
+    1) Cria as tabelas de controle em cada banco e confere os planos (SCHEMA_CHECK).
+    2) Fila por horário do próximo ciclo; entre tenants já vencidos, quem espera
+       há mais tempo roda primeiro (um ciclo por vez, depois volta ao fim da fila).
+    3) No máximo 'workers' ciclos simultâneos e um ciclo em andamento por tenant.
+    4) 'once': cada tenant sai da fila ao ficar ocioso; retorna quando todos saírem.
+    """
+    for tenant in tenants:
+        try:
+            with tenant.engine.connect() as conn:
+                ensure_service_tables(conn)
+                if SCHEMA_CHECK:
+                    check_query_plans(conn, NOTIFY_TABLES)
+        except Exception:
+            logger.exception(f"Tenant {tenant.name}: falha ao preparar o banco.")
+
+    seq = count()
+    queue = [(0.0, next(seq), tenant) for tenant in tenants]
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tenant") as pool:
+        while queue or running:
+            now = time.monotonic()
+            while queue and queue[0][0] <= now and len(running) < workers:
+                tenant = heapq.heappop(queue)[2]
+                running[pool.submit(run_tenant_cycle, tenant, sleep_seconds)] = tenant
+
+            timeout = max(0.0, queue[0][0] - now) if queue and len(running) < workers else None
+            if not running:
+                time.sleep(timeout)
+                continue
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                tenant = running.pop(future)
+                delay, idle = future.result()
+                if once and idle:
+                    continue
+                heapq.heappush(queue, (time.monotonic() + (0 if once else delay), next(seq), tenant))
@@ -0,0 +1,93 @@
+"""
+Benchmark da classificação de texto livre (rows/s) sobre
+data/sample_nao_estruturados.csv: varredura antiga (re.search por padrão)
+contra o EXAM_MATCHER compilado (sem e com o cache de classificação), e
+classify_exams_batch sobre o chunk inteiro.
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/bench_classify.py [--repeat 20]
+"""
+import argparse
+import csv
+import os
+import re
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from domain.exam_utils import (  # noqa: E402
+    CLASSIFICATION_CACHE, EXAM_PATTERNS, HAS_UNIDECODE, IGNORE_TERMS, TUSS_EXAMS, classify_exams,
+    classify_exams_batch, classify_text,
+)
+
+if HAS_UNIDECODE:
+    from unidecode import unidecode
+
+def normalize_text_legacy(txt):
+    """Versão anterior de normalize_text (unidecode + 3 re.sub por linha)."""
+    if not txt:
+        return ""
+    txt_lower = txt.lower()
+    if HAS_UNIDECODE:
+        txt_lower = unidecode(txt_lower)
+    txt_lower = re.sub(r'fncia', 'nancia', txt_lower)
+    txt_lower = re.sub(r'\b(adicional|recomendada|programada|do|da|de)\b', '', txt_lower)
+    txt_lower = re.sub(r'\s+', ' ', txt_lower).strip()
+    return txt_lower
+
+def classify_exam_legacy(cd_tuss, ds_receita):
+    """Versão anterior: um re.search por padrão, para no primeiro acerto."""
+    if cd_tuss and cd_tuss in TUSS_EXAMS:
+        return TUSS_EXAMS[cd_tuss]
+    norm = normalize_text_legacy(ds_receita)
+    if not norm or norm in IGNORE_TERMS:
+        return ("Sem Exame", "nao_imagem")
+    for (rgx, exame_final, ex_type) in EXAM_PATTERNS:
+        if re.search(rgx, norm, re.IGNORECASE):
+            return (exame_final, ex_type)
+    return (norm.title(), "nao_imagem")
+
+def load_texts(path):
+    with open(path, encoding="utf-8") as f:
+        return [row["DS_RECEITA"] for row in csv.DictReader(f)]
+
+def run(label, fn, texts, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for txt in texts:
+            fn(None, txt)
+    elapsed = time.perf_counter() - start
+    rows = len(texts) * repeat
+    print(f"{label:<10} {rows:>9} linhas  {elapsed:8.3f}s  {rows / elapsed:12,.0f} linhas/s")
+    return elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=os.path.join(BASE_DIR, "data", "sample_nao_estruturados.csv"))
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    texts = load_texts(args.csv)
+    multi = sum(1 for t in texts if len(classify_exams(None, t)) > 1)
+    print(f"{len(texts)} receitas, {multi} com mais de um exame identificado.")
+
+    before = run("antes", classify_exam_legacy, texts, args.repeat)
+    after = run("depois", lambda cd_tuss, txt: classify_text(txt, cache=None), texts, args.repeat)
+    print(f"Ganho: {before / after:.2f}x")
+    CLASSIFICATION_CACHE.clear()
+    cached = run("cache", classify_exams, texts, args.repeat)
+    print(f"Ganho com cache: {before / cached:.2f}x (acerto {CLASSIFICATION_CACHE.hit_ratio():.1%})")
+    CLASSIFICATION_CACHE.clear()
+
+    import pandas as pd
+    series = pd.Series(texts * args.repeat, dtype=object)
+    codes = pd.Series([None] * len(series), dtype=object)
+    start = time.perf_counter()
+    classify_exams_batch(codes, series)
+    elapsed = time.perf_counter() - start
+    print(f"{'lote':<10} {len(series):>9} linhas  {elapsed:8.3f}s  {len(series) / elapsed:12,.0f} linhas/s")
+
+if __name__ == "__main__":
+    main()
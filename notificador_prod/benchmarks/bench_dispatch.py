@@ -0,0 +1,53 @@
+"""
+Teste de carga do dispatcher concorrente contra o fake local do Twilio
+(mensagens/s e quantidade de 429 recebidos).
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/bench_dispatch.py --messages 500 --workers 16 --rate 40 --latency-ms 150
+"""
+import argparse
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_twilio import start_fake_twilio  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=40, help="limite do token bucket (msg/s)")
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--max-rps", type=int, default=None, help="limite do fake (429 acima dele)")
+    args = parser.parse_args()
+
+    server = start_fake_twilio(latency=args.latency_ms / 1000, max_rps=args.max_rps)
+
+    # As configurações são lidas no import, então precisam vir antes dele.
+    os.environ.update({
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": "fake",
+        "TWILIO_API_BASE_URL": server.url,
+        "TWILIO_MAX_WORKERS": str(args.workers),
+        "TWILIO_RATE_LIMIT": str(args.rate),
+    })
+    import logging
+    logging.getLogger("notifier").setLevel(logging.WARNING)
+    logging.getLogger("twilio").setLevel(logging.WARNING)
+    from infrastructure.dispatcher import dispatch_notifications
+
+    batch = [(f"11{i:09d}", "Paciente", [("Mamografia", "imagem")]) for i in range(args.messages)]
+    start = time.perf_counter()
+    results = dispatch_notifications(batch, max_workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    ok = sum(results.values())
+    print(f"{ok}/{len(batch)} enviadas em {elapsed:.2f}s = {ok / elapsed:,.1f} msg/s")
+    print(f"Fake: {server.stats}")
+
+if __name__ == "__main__":
+    main()
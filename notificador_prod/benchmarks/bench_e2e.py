@@ -0,0 +1,90 @@
+"""
+Benchmark ponta a ponta: dados sintéticos em um Postgres LOCAL e descartável
+(DATABASE_URL) + fake do Twilio com latência configurável, executando os
+mesmos ciclos de infinite_loop até esvaziar o backlog.
+
+Saída: linhas/s, mensagens/s, pico de RSS e tempo por estágio.
+
+Uso (a partir de notificador_prod/):
+    DATABASE_URL=postgresql://postgres@localhost/notificador_dev \\
+        python benchmarks/bench_e2e.py --rows 1000000 --chunk-size 50000 --latency-ms 100
+"""
+import argparse
+import logging
+import os
+import resource
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_twilio import start_fake_twilio  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000, help="linhas por tabela")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--latency-ms", type=float, default=100, help="latência do fake do Twilio")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de envios recusados pelo fake")
+    parser.add_argument("--workers", type=int, default=32, help="envios simultâneos")
+    parser.add_argument("--rate", type=float, default=1000, help="limite do token bucket (msg/s)")
+    parser.add_argument("--skip-load", action="store_true", help="reaproveita os dados já carregados")
+    args = parser.parse_args()
+
+    server = start_fake_twilio(latency=args.latency_ms / 1000, error_rate=args.error_rate)
+    # As configurações são lidas no import, então precisam vir antes dele.
+    os.environ.update({
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32,
+        "TWILIO_AUTH_TOKEN": "fake",
+        "TWILIO_API_BASE_URL": server.url,
+        "TWILIO_MAX_WORKERS": str(args.workers),
+        "TWILIO_RATE_LIMIT": str(args.rate),
+        "METRICS_PORT": os.environ.get("METRICS_PORT", "0"),  # coleta em memória, sem servidor
+    })
+    logging.getLogger("notifier").setLevel(logging.WARNING)
+    logging.getLogger("twilio").setLevel(logging.WARNING)
+
+    from sqlalchemy import text
+    from infrastructure import metrics
+    from infrastructure.database import get_engine, ensure_service_tables
+    from application.notification_service import run_cycle
+    from synth_data import load_into_db
+
+    engine = get_engine()
+    if not args.skip_load:
+        start = time.perf_counter()
+        load_into_db(engine, args.rows)
+        print(f"Carga: {2 * args.rows} linhas em {time.perf_counter() - start:.1f}s")
+    with engine.connect() as conn:
+        ensure_service_tables(conn)
+        if not args.skip_load:
+            conn.execute(text("TRUNCATE public.notification_leases, public.notification_outbox"))
+            conn.commit()
+
+    cycles = 0
+    start = time.perf_counter()
+    while run_cycle(args.chunk_size)[0]:
+        cycles += 1
+    elapsed = time.perf_counter() - start
+
+    rows = sum(metrics.counter_totals("notifier_rows_read_total").values())
+    messages = metrics.counter_totals("notifier_messages_total")
+    sent = messages.get((("result", "sent"),), 0)
+    failed = messages.get((("result", "failed"),), 0)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print(f"{cycles} ciclos em {elapsed:.1f}s (chunk_size={args.chunk_size})")
+    print(f"Linhas:    {rows:>10} ({rows / elapsed:,.0f}/s)")
+    print(f"Mensagens: {sent:>10} ({sent / elapsed:,.0f}/s), falhas: {failed}")
+    print(f"Pico RSS:  {peak_rss_mb:,.0f} MB")
+    print("Tempo por estágio:")
+    for key, (count, total) in metrics.histogram_totals("notifier_stage_seconds").items():
+        stage = dict(key)["stage"]
+        print(f"  {stage:<9} {total:8.2f}s  ({count} chamadas, {total / max(count, 1) * 1000:,.1f} ms/chamada)")
+    for key, (count, total) in metrics.histogram_totals("notifier_db_seconds").items():
+        print(f"  db:{dict(key)['op']:<6} {total:8.2f}s  ({count} chamadas)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Benchmark do limite de frequência (domain/frequency_cap.py): inserção em lotes
+do tamanho de um ciclo, memória da estrutura e consultas/s com --phones
+telefones na janela.
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/bench_frequency_cap.py [--phones 2000000] [--batch 1000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from application.adaptive import current_rss_mb  # noqa: E402
+from domain.frequency_cap import RecentlyNotified  # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--phones", type=int, default=2_000_000)
+    parser.add_argument("--batch", type=int, default=1000, help="envios por ciclo")
+    parser.add_argument("--lookups", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rnd = random.Random(42)
+    phones = [str(11_000_000_000 + n) for n in rnd.sample(range(10**9), args.phones)]
+    recent = RecentlyNotified()
+    base_rss = current_rss_mb()
+
+    start = time.perf_counter()
+    now = int(time.time())
+    for i in range(0, len(phones), args.batch):
+        recent.add_many((tel, now) for tel in phones[i:i + args.batch])
+    insert = time.perf_counter() - start
+    print(f"{len(recent)} telefones: inserção {len(phones) / insert:12,.0f}/s   "
+          f"arrays {recent.nbytes / 2**20:6.1f} MB   RSS +{current_rss_mb() - base_rss:6.1f} MB (com inserções pendentes)")
+
+    sample = [rnd.choice(phones) if rnd.random() < 0.5 else str(12_000_000_000 + rnd.randrange(10**9))
+              for _ in range(args.lookups)]
+    start = time.perf_counter()
+    hits = sum(1 for tel in sample if recent.last_notified(tel) is not None)
+    lookup = time.perf_counter() - start
+    print(f"last_notified {len(sample) / lookup:12,.0f}/s   ({lookup / len(sample) * 1e6:.1f} µs, acertos {hits / len(sample):.0%})")
+
+    start = time.perf_counter()
+    recent.prune(now)
+    print(f"prune/merge {(time.perf_counter() - start) * 1000:10.1f} ms   RSS +{current_rss_mb() - base_rss:6.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Micro-benchmarks de normalize_text, classify_exam e build_message_for_exams
+sobre as amostras de data/. Com --save/--compare detecta regressões antes do
+deploy (sai com código 1 se alguma função ficar mais lenta que a tolerância).
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/bench_micro.py --save /tmp/baseline.json
+    python benchmarks/bench_micro.py --compare /tmp/baseline.json --tolerance 0.2
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from domain.exam_utils import (  # noqa: E402
+    build_message_for_exams, classify_exam, classify_exams, classify_text, normalize_text,
+)
+
+def load_samples():
+    with open(os.path.join(BASE_DIR, "data", "sample_nao_estruturados.csv"), encoding="utf-8") as f:
+        texts = [row["DS_RECEITA"] for row in csv.DictReader(f)]
+    with open(os.path.join(BASE_DIR, "data", "sample_estruturados.csv"), encoding="utf-8") as f:
+        codes = [int(row["CD_TUSS"]) for row in csv.DictReader(f)]
+    return texts, codes
+
+def measure(fn, items, min_seconds):
+    """Operações/s de fn(item), repetindo a lista até somar 'min_seconds'."""
+    ops = 0
+    start = time.perf_counter()
+    while True:
+        for item in items:
+            fn(item)
+        ops += len(items)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return ops / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--min-seconds", type=float, default=1.0)
+    parser.add_argument("--save", help="grava os resultados em JSON (baseline)")
+    parser.add_argument("--compare", help="compara com um baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="queda máxima aceita (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    logging.getLogger("notifier").setLevel(logging.WARNING)
+    texts, codes = load_samples()
+    exam_lists = [classify_exams(None, t) + classify_exams(c, "") for t, c in zip(texts, codes * 3)]
+
+    cases = {
+        "normalize_text": (normalize_text, texts),
+        "classify_exam[texto]": (lambda t: classify_exam(None, t), texts),
+        "classify_text[sem cache]": (lambda t: classify_text(t, cache=None), texts),
+        "classify_exam[tuss]": (lambda c: classify_exam(c, ""), codes),
+        "build_message_for_exams": (lambda exams: build_message_for_exams("Paciente", exams), exam_lists),
+    }
+    results = {name: measure(fn, items, args.min_seconds) for name, (fn, items) in cases.items()}
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    regressions = []
+    for name, ops in results.items():
+        line = f"{name:<26} {ops:14,.0f} ops/s"
+        if name in baseline:
+            change = ops / baseline[name] - 1
+            line += f"  ({change:+.1%} vs baseline)"
+            if change < -args.tolerance:
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if regressions:
+        print(f"Regressão acima de {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
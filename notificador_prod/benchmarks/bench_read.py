@@ -0,0 +1,72 @@
+"""
+Benchmark da leitura dos registros reservados (READ_BACKEND): read_sql agregado
+("sql") x COPY em paralelo direto para colunas ("copy"). Cada medição roda em
+um processo novo, para que o pico de RSS seja só o da leitura.
+
+Usa as tabelas de DATABASE_URL (ex.: carregadas com synth_data.py --load) e
+lê os registros pendentes dos primeiros --tels telefones, sem reservar nem marcar.
+
+Uso (a partir de notificador_prod/):
+    DATABASE_URL=... python benchmarks/bench_read.py --tels 10000 100000 [--repeat 3]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def measure(backend, n_tels):
+    """Roda no processo filho: lê os registros de n_tels telefones e imprime o resultado em JSON."""
+    sys.path.insert(0, BASE_DIR)
+    import pandas  # noqa: F401  (import fora da medição de memória)
+    from sqlalchemy import text
+    from infrastructure.database import get_engine
+    from application.notification_service import explode_records, read_claimed, read_claimed_copy
+
+    engine = get_engine()
+    with engine.connect() as conn:
+        tels = [row[0] for row in conn.execute(
+            text("SELECT DISTINCT tel FROM public.dados_estruturados WHERE NOT notified LIMIT :n"), {"n": n_tels}
+        )]
+        conn.commit()
+        base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        if backend == "copy":
+            df = read_claimed_copy(conn, tels)
+        else:
+            df = explode_records(read_claimed(conn, tels))
+        conn.commit()
+        elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rows": len(df), "seconds": elapsed, "peak_mb": (peak - base_rss) / 1024}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tels", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure(args.child[0], int(args.child[1]))
+        return
+
+    for n_tels in args.tels:
+        for backend in ("sql", "copy"):
+            runs = []
+            for _ in range(args.repeat):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", backend, str(n_tels)],
+                    cwd=BASE_DIR, check=True, capture_output=True, text=True,
+                ).stdout
+                runs.append(json.loads(out.strip().splitlines()[-1]))
+            best = min(runs, key=lambda r: r["seconds"])
+            print(f"{n_tels:>8} telefones  {backend:<4}  {best['rows']:>9} linhas  "
+                  f"{best['seconds'] * 1000:9.1f} ms  pico +{max(r['peak_mb'] for r in runs):7.1f} MB")
+
+if __name__ == "__main__":
+    main()
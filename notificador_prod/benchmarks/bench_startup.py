@@ -0,0 +1,65 @@
+"""
+Benchmark de cold start: tempo de import (processo novo a cada medição) do
+caminho de serviço e, opcionalmente, de uma execução completa `main.py --once`.
+Lista os módulos mais caros segundo `python -X importtime`.
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/bench_startup.py [--repeat 5] [--top 10]
+    DATABASE_URL=... python benchmarks/bench_startup.py --once   # inclui main.py --once (sem envios reais)
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    "import main": "import main",
+    "import notification_service": "import application.notification_service",
+    "import pandas": "import pandas",
+}
+
+def wall_ms(argv, env):
+    start = time.perf_counter()
+    subprocess.run(argv, cwd=BASE_DIR, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def import_profile(code, env, top):
+    """Módulos com maior tempo cumulativo de import (ms), via -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]) / 1000, parts[2].strip()))
+    return sorted(rows, reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--once", action="store_true", help="mede também main.py --once contra DATABASE_URL")
+    args = parser.parse_args()
+
+    env = dict(os.environ, TWILIO_ACCOUNT_SID="TWILIO_ACCOUNT_SID", USE_PANDAS=os.getenv("USE_PANDAS", "false"))
+    commands = {name: [sys.executable, "-c", code] for name, code in TARGETS.items()}
+    commands["python (vazio)"] = [sys.executable, "-c", "pass"]
+    if args.once:
+        commands["main.py --once"] = [sys.executable, "main.py", "--once"]
+
+    for name, argv in commands.items():
+        samples = [wall_ms(argv, env) for _ in range(args.repeat)]
+        print(f"{name:<30} mediana {statistics.median(samples):8.1f} ms  (min {min(samples):.1f})")
+
+    print("\nMódulos mais caros (main + notification_service):")
+    for ms, module in import_profile("import main, application.notification_service", env, args.top):
+        print(f"  {ms:8.1f} ms  {module}")
+
+if __name__ == "__main__":
+    main()
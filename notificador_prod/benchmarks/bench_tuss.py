@@ -0,0 +1,87 @@
+"""
+Benchmark do índice TUSS (domain/tuss_index.py): tempo de carga do CSV e do
+binário (mmap), tamanho em memória, buscas/s (uma a uma e vetorizada) e
+cobertura dos códigos de data/sample_estruturados.csv.
+
+A terminologia usada é sintética (--codes códigos exatos e --families faixas),
+mais um índice montado com os próprios pares CD_TUSS/DS_RECEITA da amostra.
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/bench_tuss.py [--codes 6000] [--families 300]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from domain.exam_utils import TUSS_EXAMS  # noqa: E402
+from domain.tuss_index import TussIndex, load_tuss_index  # noqa: E402
+
+def write_terminology(path, n_codes, n_families, seed=42):
+    """CSV sintético: famílias por prefixo de 3 a 5 dígitos e códigos exatos de 8 dígitos."""
+    rnd = random.Random(seed)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["codigo", "exame", "ex_type"])
+        for i in range(n_families):
+            prefix = str(rnd.randint(400, 419)) + str(rnd.randint(0, 99)).zfill(2)[: rnd.randint(0, 2)]
+            writer.writerow([prefix + "*", f"Família {i}", rnd.choice(["imagem", "nao_imagem"])])
+        for code in rnd.sample(range(40000000, 42000000), n_codes):
+            writer.writerow([code, f"Procedimento {code}", rnd.choice(["imagem", "nao_imagem"])])
+
+def index_bytes(index):
+    arrays = (index.codes, index.code_labels, index.starts, index.ends, index.range_labels)
+    return sum(memoryview(a).nbytes for a in arrays) + sum(len(e) + len(t) for e, t in index.labels)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--codes", type=int, default=6000)
+    parser.add_argument("--families", type=int, default=300)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    import logging
+    logging.getLogger("notifier").setLevel(logging.WARNING)
+
+    tmp = tempfile.mkdtemp()
+    csv_path, bin_path = os.path.join(tmp, "tuss.csv"), os.path.join(tmp, "tuss.bin")
+    write_terminology(csv_path, args.codes, args.families)
+
+    start = time.perf_counter()
+    index = load_tuss_index(csv_path, base=TUSS_EXAMS)
+    csv_ms = (time.perf_counter() - start) * 1000
+    index.save(bin_path)
+    start = time.perf_counter()
+    mapped = load_tuss_index(bin_path)
+    bin_ms = (time.perf_counter() - start) * 1000
+    print(f"{len(index)} códigos, {len(index.starts)} segmentos de faixa, {len(index.labels)} rótulos")
+    print(f"carga CSV {csv_ms:8.1f} ms   carga .bin (mmap) {bin_ms:6.2f} ms   "
+          f"memória ~{index_bytes(index) / 2**20:.2f} MB   arquivo {os.path.getsize(bin_path) / 2**20:.2f} MB")
+
+    rnd = random.Random(1)
+    codes = [rnd.randint(40000000, 42000000) for _ in range(args.lookups)]
+    for name, idx in (("csv", index), ("mmap", mapped)):
+        start = time.perf_counter()
+        hits = sum(1 for c in codes if idx.lookup(c) is not None)
+        scalar = len(codes) / (time.perf_counter() - start)
+        start = time.perf_counter()
+        idx.lookup_array(codes)
+        vector = len(codes) / (time.perf_counter() - start)
+        print(f"lookup[{name:<4}] {scalar:12,.0f}/s   lookup_array {vector:14,.0f}/s   acertos {hits / len(codes):.1%}")
+
+    with open(os.path.join(BASE_DIR, "data", "sample_estruturados.csv"), encoding="utf-8") as f:
+        rows = [(int(r["CD_TUSS"]), r["DS_RECEITA"]) for r in csv.DictReader(f) if r["CD_TUSS"]]
+    default = TussIndex.build(TUSS_EXAMS)
+    sample = TussIndex.build({**TUSS_EXAMS, **{code: (term, "nao_imagem") for code, term in rows}})
+    for name, idx in (("TUSS_EXAMS", default), ("terminologia", sample)):
+        covered = sum(1 for code, _ in rows if idx.lookup(code) is not None)
+        print(f"cobertura da amostra ({name:<12}): {covered / len(rows):6.1%} das linhas estruturadas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Verifica a reserva de telefones com vários workers concorrentes contra um
+Postgres LOCAL e descartável (DATABASE_URL): nenhum telefone pode ser
+processado por mais de um worker. Confere também um worker mais lento que
+LEASE_SECONDS: com LeaseHeartbeat a reserva é renovada e ninguém a retoma;
+sem ele (controle) outro worker a retoma e a renovação tardia acusa a perda.
+
+Uso (a partir de notificador_prod/):
+    DATABASE_URL=postgresql://postgres@localhost/notificador_dev \\
+        python benchmarks/check_claims.py --seed 20000 --workers 6
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text  # noqa: E402
+from infrastructure.database import (  # noqa: E402
+    get_engine, ensure_service_tables, claim_pending_tels, mark_as_notified_by_tels, release_claims,
+)
+from infrastructure.leases import LeaseHeartbeat  # noqa: E402
+from synth_data import load_into_db  # noqa: E402
+
+engine = get_engine()
+
+def seed(rows):
+    """Recria o backlog sintético e limpa as reservas."""
+    load_into_db(engine, rows)
+    with engine.connect() as conn:
+        ensure_service_tables(conn)
+        conn.execute(text("TRUNCATE public.notification_leases, public.notification_outbox"))
+        conn.commit()
+
+def worker(args):
+    """Reserva, 'envia' (marca) e libera até o backlog acabar."""
+    worker_id, chunk_size = args
+    engine.dispose(close=False)  # não reaproveita conexões herdadas do processo pai
+    processed = []
+    with engine.connect() as conn:
+        while True:
+            tels = claim_pending_tels(conn, worker_id, chunk_size, lease_seconds=60)
+            if not tels:
+                break
+            processed.extend(tels)
+            mark_as_notified_by_tels(conn, tels)
+            release_claims(conn, worker_id, tels)
+    return processed
+
+def check_lease_expiry(lease_seconds=2, rows=200):
+    """
+    Um worker reserva telefones e demora o dobro de 'lease_seconds'; outro
+    tenta reservar tudo nesse meio-tempo. Retorna True se, com heartbeat,
+    nenhum telefone foi retomado e, sem heartbeat, todos foram (e held() os exclui).
+    """
+    ok = True
+    for heartbeat in (True, False):
+        seed(rows)
+        with engine.connect() as conn:
+            slow = claim_pending_tels(conn, "slow", rows, lease_seconds)
+            keeper = LeaseHeartbeat(engine, slow, worker_id="slow", lease_seconds=lease_seconds)
+            if heartbeat:
+                keeper.start()
+            time.sleep(lease_seconds * 2)
+            other = claim_pending_tels(conn, "other", rows * 10, 60)
+            if heartbeat:
+                keeper.stop()
+            else:
+                keeper.renew()
+        taken = set(slow) & set(other)
+        lost = set(slow) - set(keeper.held(slow))
+        expected = (not taken and not lost) if heartbeat else (taken == set(slow) and lost == taken)
+        ok = ok and bool(slow) and expected
+        print(f"Worker além da reserva ({'com' if heartbeat else 'sem'} heartbeat): {len(slow)} reservados, "
+              f"{len(taken)} retomados por outro worker, {len(lost)} perdidos -> {'ok' if expected else 'FALHA'}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=20000, help="linhas por tabela")
+    parser.add_argument("--workers", type=int, default=6)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    seed(args.seed)
+    start = time.perf_counter()
+    with Pool(args.workers) as pool:
+        per_worker = pool.map(worker, [(f"check-{i}", args.chunk_size) for i in range(args.workers)])
+    elapsed = time.perf_counter() - start
+
+    counts = Counter(tel for tels in per_worker for tel in tels)
+    duplicated = [tel for tel, n in counts.items() if n > 1]
+    print(f"{len(counts)} telefones em {elapsed:.2f}s; por worker: {[len(t) for t in per_worker]}")
+    print(f"Telefones processados por mais de um worker: {len(duplicated)}")
+    leases_ok = check_lease_expiry()
+    sys.exit(1 if duplicated or not leases_ok else 0)
+
+if __name__ == "__main__":
+    main()
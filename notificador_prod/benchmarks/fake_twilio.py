@@ -0,0 +1,104 @@
+"""
+Endpoint local que imita a API de mensagens do Twilio, para testes de carga
+offline (apontar TWILIO_API_BASE_URL para ele).
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/fake_twilio.py --port 8099 --latency-ms 150 --max-rps 50
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeTwilioHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        server = self.server
+        time.sleep(server.latency)
+
+        if not self.path.endswith("/Messages.json"):
+            return self._reply(404, {"code": 20404, "message": "Not Found", "status": 404})
+        if not server.take_slot():
+            server.count("throttled")
+            return self._reply(429, {"code": 20429, "message": "Too Many Requests", "status": 429})
+        if server.error_rate and random.random() < server.error_rate:
+            server.count("rejected")
+            return self._reply(400, {"code": 21211, "message": "Invalid 'To' Phone Number", "status": 400})
+        server.count("accepted")
+        self._reply(201, {"sid": "SM" + uuid.uuid4().hex, "status": "queued"})
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+class FakeTwilioServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, max_rps=None, error_rate=0.0):
+        super().__init__(address, FakeTwilioHandler)
+        self.latency = latency
+        self.max_rps = max_rps
+        self.error_rate = error_rate
+        self.stats = {"accepted": 0, "throttled": 0, "rejected": 0}
+        self._lock = threading.Lock()
+        self._window = (0, 0)  # (segundo, requisições aceitas nele)
+
+    def take_slot(self):
+        """Simula o limite de mensagens/s da conta (responde 429 acima dele)."""
+        if not self.max_rps:
+            return True
+        with self._lock:
+            second = int(time.monotonic())
+            current, used = self._window
+            if second != current:
+                current, used = second, 0
+            if used >= self.max_rps:
+                return False
+            self._window = (current, used + 1)
+            return True
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start_fake_twilio(port=0, latency=0.0, max_rps=None, error_rate=0.0):
+    """Sobe o fake em uma thread daemon e retorna o servidor (ver .url/.stats)."""
+    server = FakeTwilioServer(("127.0.0.1", port), latency=latency, max_rps=max_rps, error_rate=error_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake local da API de mensagens do Twilio.")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency-ms", type=float, default=150)
+    parser.add_argument("--max-rps", type=int, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de envios recusados (400)")
+    args = parser.parse_args()
+
+    server = FakeTwilioServer(("127.0.0.1", args.port), args.latency_ms / 1000, args.max_rps, args.error_rate)
+    print(f"Fake Twilio em {server.url} (latência {args.latency_ms}ms, max_rps={args.max_rps})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats)
+
+if __name__ == "__main__":
+    main()
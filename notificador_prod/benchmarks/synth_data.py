@@ -0,0 +1,148 @@
+"""
+Gerador de dados sintéticos no formato de data/sample_estruturados.csv e
+data/sample_nao_estruturados.csv, para benchmarks com milhões de linhas.
+
+- Textos, pares (CD_TUSS, DS_RECEITA) e nomes são sorteados das amostras reais.
+- Parte das receitas livres recebe um pedido de exame de imagem.
+- Os telefones se repetem dentro e entre as tabelas (pacientes com vários registros).
+
+Uso (a partir de notificador_prod/):
+    python benchmarks/synth_data.py --rows 1000000 --out /tmp/synth
+    DATABASE_URL=... python benchmarks/synth_data.py --rows 1000000 --load
+"""
+import argparse
+import csv
+import io
+import os
+import random
+from datetime import date, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+
+STRUCTURED = "dados_estruturados"
+UNSTRUCTURED = "dados_nao_estruturados"
+COLUMNS = {
+    STRUCTURED: ["id", "data", "tel", "cpf", "solicitante", "cd_tuss", "ds_receita"],
+    UNSTRUCTURED: ["id", "data", "tel", "cpf", "solicitante", "ds_receita"],
+}
+
+# DDL mínima das tabelas do cliente, para um Postgres local descartável
+SEED_DDL = [
+    "CREATE TABLE IF NOT EXISTS public.dados_estruturados ("
+    "id bigint PRIMARY KEY, data date, tel text, cpf text, solicitante text, "
+    "cd_tuss bigint, ds_receita text, notified boolean NOT NULL DEFAULT false)",
+    "CREATE TABLE IF NOT EXISTS public.dados_nao_estruturados ("
+    "id bigint PRIMARY KEY, data date, tel text, cpf text, solicitante text, "
+    "ds_receita text, notified boolean NOT NULL DEFAULT false)",
+]
+
+IMAGING_REQUESTS = [
+    "Solicito tomografia computadorizada de crânio",
+    "Ultrassonografia de abdome total",
+    "RESSONANCIA MAGNETICA DE JOELHO DIREITO",
+    "Mamografia bilateral de rastreamento",
+    "Raio-x de tórax PA e perfil",
+    "Solicito colonoscopia e endoscopia digestiva alta",
+]
+
+def _load_samples():
+    with open(os.path.join(DATA_DIR, "sample_estruturados.csv"), encoding="utf-8") as f:
+        structured = list(csv.DictReader(f))
+    with open(os.path.join(DATA_DIR, "sample_nao_estruturados.csv"), encoding="utf-8") as f:
+        unstructured = list(csv.DictReader(f))
+    return {
+        "tuss_pairs": [(r["CD_TUSS"], r["DS_RECEITA"]) for r in structured],
+        "texts": [r["DS_RECEITA"] for r in unstructured],
+        "names": sorted({r["SOLICITANTE"] for r in structured + unstructured}),
+    }
+
+def generate_rows(table, rows, phones=None, imaging_ratio=0.1, seed=42, start_id=1):
+    """
+    Gera 'rows' tuplas (na ordem de COLUMNS[table]).
+    - phones: quantidade de telefones distintos (padrão: 70% de 'rows',
+      compartilhados entre as duas tabelas).
+    """
+    samples = _load_samples()
+    rnd = random.Random(f"{seed}-{table}")
+    phones = phones or max(1, int(rows * 0.7))
+    first_day = date(2020, 1, 1)
+    for i in range(start_id, start_id + rows):
+        p = rnd.randrange(phones)
+        tel = f"11{p:08d}"
+        row = [i, (first_day + timedelta(days=rnd.randrange(366))).isoformat(), tel,
+               f"123{p:08d}", rnd.choice(samples["names"])]
+        if table == STRUCTURED:
+            row.extend(rnd.choice(samples["tuss_pairs"]))
+        else:
+            text = rnd.choice(samples["texts"])
+            if rnd.random() < imaging_ratio:
+                text = f"{text} {rnd.choice(IMAGING_REQUESTS)}"
+            row.append(text)
+        yield row
+
+def write_csv(path, table, rows, **kwargs):
+    """Escreve um CSV no mesmo formato das amostras (cabeçalho em maiúsculas)."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([c.upper() for c in COLUMNS[table]])
+        writer.writerows(generate_rows(table, rows, **kwargs))
+
+def load_into_db(engine, rows, batch=100_000, **kwargs):
+    """
+    Recria as duas tabelas com 'rows' linhas cada, via COPY em lotes.
+    Use apenas em um banco local descartável (TRUNCATE).
+    """
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        for ddl in SEED_DDL:
+            conn.execute(text(ddl))
+        conn.execute(text(f"TRUNCATE public.{STRUCTURED}, public.{UNSTRUCTURED}"))
+        conn.commit()
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        for table in (STRUCTURED, UNSTRUCTURED):
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            copy_sql = f"COPY public.{table} ({', '.join(COLUMNS[table])}, notified) FROM STDIN WITH (FORMAT csv)"
+            for n, row in enumerate(generate_rows(table, rows, **kwargs), 1):
+                writer.writerow(row + ["f"])
+                if n % batch == 0:
+                    buf.seek(0)
+                    cur.copy_expert(copy_sql, buf)
+                    buf = io.StringIO()
+                    writer = csv.writer(buf)
+            buf.seek(0)
+            cur.copy_expert(copy_sql, buf)
+            cur.execute(f"ANALYZE public.{table}")
+        raw.commit()
+    finally:
+        raw.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos para benchmarks.")
+    parser.add_argument("--rows", type=int, default=100_000, help="linhas por tabela")
+    parser.add_argument("--phones", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="diretório de saída dos CSVs")
+    parser.add_argument("--load", action="store_true", help="carrega no DATABASE_URL (TRUNCATE!)")
+    args = parser.parse_args()
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        for table, name in ((STRUCTURED, "estruturados"), (UNSTRUCTURED, "nao_estruturados")):
+            path = os.path.join(args.out, f"synth_{name}.csv")
+            write_csv(path, table, args.rows, phones=args.phones, seed=args.seed)
+            print(f"{path}: {args.rows} linhas")
+    if args.load:
+        import sys
+        sys.path.insert(0, BASE_DIR)
+        from infrastructure.database import get_engine
+        load_into_db(get_engine(), args.rows, phones=args.phones, seed=args.seed)
+        print(f"{args.rows} linhas carregadas por tabela.")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+import socket
 import logging
 
 # Configurações de Logging
@@ -16,3 +17,97 @@ TWILIO_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")
 COMPANY_NAME = os.getenv("COMPANY_NAME")
 PLATFORM_LINK = os.getenv("PLATFORM_LINK")
 USE_SANDBOX = os.getenv("USE_SANDBOX", "true").lower() == "true"
+
+# Envio concorrente (Twilio)
+TWILIO_MAX_WORKERS = int(os.getenv("TWILIO_MAX_WORKERS", "8"))
+TWILIO_RATE_LIMIT = float(os.getenv("TWILIO_RATE_LIMIT", "10"))  # mensagens/segundo da conta
+TWILIO_MAX_RETRIES = int(os.getenv("TWILIO_MAX_RETRIES", "4"))  # tentativas extras em HTTP 429
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")  # ex.: http://localhost:8099 (fake local)
+
+# Múltiplas réplicas: cada worker reserva (lease) os telefones que vai processar
+WORKER_ID = os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+LEASE_SECONDS = int(os.getenv("LEASE_SECONDS", "300"))  # expiração da reserva (worker que caiu)
+
+# Acordar por LISTEN/NOTIFY (triggers de INSERT) em vez de polling fixo
+USE_LISTEN_NOTIFY = os.getenv("USE_LISTEN_NOTIFY", "false").lower() == "true"
+NOTIFY_CHANNEL = os.getenv("NOTIFY_CHANNEL", "notificador_pending")
+LISTEN_FALLBACK_SECONDS = int(os.getenv("LISTEN_FALLBACK_SECONDS", "300"))  # varredura de segurança
+
+# Pipeline em estágios (leitura, classificação, envio e marcação sobrepostos)
+USE_PIPELINE = os.getenv("USE_PIPELINE", "false").lower() == "true"
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))  # chunks em espera entre estágios
+CLASSIFY_PROCESSES = int(os.getenv("CLASSIFY_PROCESSES", str(os.cpu_count() or 1)))
+
+# Template da mensagem (arquivo opcional; placeholders: {client_name}, {exams},
+# {platform_link}, {company_name})
+MESSAGE_TEMPLATE_FILE = os.getenv("MESSAGE_TEMPLATE_FILE")
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "4096"))  # blocos de exames em cache (LRU)
+
+# Métricas Prometheus (desligadas se METRICS_PORT não for definido)
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if os.getenv("METRICS_PORT") else None
+METRICS_ENABLED = METRICS_PORT is not None
+
+# Outbox de reenvio: falhas por telefone com backoff exponencial e dead-letter
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_BASE_DELAY = int(os.getenv("OUTBOX_BASE_DELAY", "60"))  # segundos até a 2ª tentativa
+OUTBOX_MAX_DELAY = int(os.getenv("OUTBOX_MAX_DELAY", "86400"))
+OUTBOX_QUOTA_DELAY = int(os.getenv("OUTBOX_QUOTA_DELAY", "3600"))  # limite diário (63038) não conta tentativa
+OUTBOX_TRANSIENT_DELAY = int(os.getenv("OUTBOX_TRANSIENT_DELAY", "300"))  # 5xx, timeout, 429 esgotado: não conta tentativa
+OUTBOX_DEAD_RETENTION = int(os.getenv("OUTBOX_DEAD_RETENTION", "604800"))  # dead-letter volta a ser tentado depois disso
+
+# Tamanho do chunk e intervalo entre ciclos (ADAPTIVE_CHUNKING ajusta dentro dos limites)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+SLEEP_SECONDS = int(os.getenv("SLEEP_SECONDS", "30"))
+ADAPTIVE_CHUNKING = os.getenv("ADAPTIVE_CHUNKING", "false").lower() == "true"
+CHUNK_SIZE_MIN = int(os.getenv("CHUNK_SIZE_MIN", "100"))
+CHUNK_SIZE_MAX = int(os.getenv("CHUNK_SIZE_MAX", "50000"))
+TARGET_CYCLE_SECONDS = float(os.getenv("TARGET_CYCLE_SECONDS", "60"))
+MEMORY_LIMIT_MB = int(os.getenv("MEMORY_LIMIT_MB", "1024"))
+
+# Multi-tenant: várias clínicas (um banco cada) atendidas pelo mesmo processo
+TENANTS_FILE = os.getenv("TENANTS_FILE")  # JSON com a lista de tenants (ver README)
+TENANT_WORKERS = int(os.getenv("TENANT_WORKERS", "4"))  # ciclos de tenants simultâneos
+TENANT_POOL_SIZE = int(os.getenv("TENANT_POOL_SIZE", "2"))  # conexões por tenant (sem overflow)
+
+# Cache de classificação: LRU em memória (textos distintos) e, opcionalmente,
+# tabela no banco compartilhada entre ciclos, réplicas e reinícios
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "100000"))
+CLASSIFY_CACHE_DB = os.getenv("CLASSIFY_CACHE_DB", "false").lower() == "true"
+
+# Modo batch (python main.py batch): exportações CSV processadas sem banco
+BATCH_CHUNK_ROWS = int(os.getenv("BATCH_CHUNK_ROWS", "100000"))  # linhas lidas por chunk
+BATCH_PARTITIONS = int(os.getenv("BATCH_PARTITIONS", "64"))  # arquivos temporários (agrupamento por telefone)
+BATCH_PARTITION_BYTES = int(os.getenv("BATCH_PARTITION_BYTES", str(64 * 1024 * 1024)))  # acima disso, a partição é re-dividida
+
+# Leitura/classificação com pandas (false: caminho em Python puro, sem importar
+# o pandas; útil para cold start em Cloud Run/Functions)
+USE_PANDAS = os.getenv("USE_PANDAS", "true").lower() == "true"
+
+# Terminologia TUSS completa (CSV: codigo, exame, ex_type; ou .bin compilado com
+# `python main.py tuss-index`), além dos códigos fixos de TUSS_EXAMS
+TUSS_INDEX_FILE = os.getenv("TUSS_INDEX_FILE")
+
+# Escalonador por prioridade: com a cota diária do provedor (63038), os envios vão
+# primeiro para os telefones de maior pontuação e são distribuídos na janela do dia
+PRIORITY_SCHEDULING = os.getenv("PRIORITY_SCHEDULING", "false").lower() == "true"
+DAILY_SEND_LIMIT = int(os.getenv("DAILY_SEND_LIMIT")) if os.getenv("DAILY_SEND_LIMIT") else None
+SEND_WINDOW_START = float(os.getenv("SEND_WINDOW_START", "0"))  # hora do dia (ex.: 8)
+SEND_WINDOW_END = float(os.getenv("SEND_WINDOW_END", "24"))  # hora do dia (ex.: 20)
+PRIORITY_WEIGHT_IMAGEM = float(os.getenv("PRIORITY_WEIGHT_IMAGEM", "100"))  # algum exame de imagem
+PRIORITY_WEIGHT_EXAM = float(os.getenv("PRIORITY_WEIGHT_EXAM", "10"))  # por exame pendente
+PRIORITY_WEIGHT_AGE_DAY = float(os.getenv("PRIORITY_WEIGHT_AGE_DAY", "-1"))  # por dia desde a prescrição (DATA)
+PRIORITY_CANDIDATES = int(os.getenv("PRIORITY_CANDIDATES", "10000"))  # tamanho máximo do heap
+PRIORITY_SCAN_ROWS = int(os.getenv("PRIORITY_SCAN_ROWS", "10000"))  # registros lidos por tabela a cada passo
+
+# Conferência do schema na inicialização: avisa se as consultas quentes fazem
+# Seq Scan (faltam os índices parciais de `python main.py schema`)
+SCHEMA_CHECK = os.getenv("SCHEMA_CHECK", "true").lower() == "true"
+SCHEMA_CHECK_MIN_ROWS = int(os.getenv("SCHEMA_CHECK_MIN_ROWS", "100000"))  # tabelas menores são ignoradas
+
+# Leitura dos registros reservados (com USE_PANDAS): "sql" (read_sql agregado) ou
+# "copy" (COPY ... TO STDOUT das duas tabelas em paralelo, direto para colunas)
+READ_BACKEND = os.getenv("READ_BACKEND", "sql").lower()
+
+# Limite de frequência por telefone: quem recebeu mensagem há menos de
+# FREQUENCY_CAP_SECONDS tem os exames novos adiados e agrupados em um envio só (0 = desligado)
+FREQUENCY_CAP_SECONDS = int(os.getenv("FREQUENCY_CAP_SECONDS", "0"))
@@ -1,4 +1,9 @@
 import re
+import hashlib
+import threading
+from collections import OrderedDict
+from config.settings import CLASSIFY_CACHE_SIZE, TUSS_INDEX_FILE
+from domain.tuss_index import TussIndex, load_tuss_index
 
 try:
     from unidecode import unidecode
@@ -6,6 +11,10 @@ try:
 except ImportError:
     HAS_UNIDECODE = False
 
+# Tabela de transliteração pré-calculada para Latin-1/Latin Extended (acentos
+# do português); só recorre ao unidecode completo para o que sobrar.
+ACCENT_TABLE = {cp: unidecode(chr(cp)) for cp in range(0x80, 0x250)} if HAS_UNIDECODE else {}
+
 # Dicionário TUSS, com (nome_exame, "imagem"/"nao_imagem")
 TUSS_EXAMS = {
     40901114: ("Ultrassonografia", "imagem"),
@@ -17,6 +26,33 @@ TUSS_EXAMS = {
     40701121: ("Endoscopia", "nao_imagem"),
 }
 
+# Índice TUSS usado na classificação: TUSS_EXAMS mais a terminologia completa
+# (códigos exatos e famílias) de TUSS_INDEX_FILE, se informado.
+if TUSS_INDEX_FILE:
+    TUSS_INDEX = load_tuss_index(TUSS_INDEX_FILE, base=TUSS_EXAMS)
+else:
+    TUSS_INDEX = TussIndex.build(TUSS_EXAMS)
+
+def lookup_tuss(cd_tuss):
+    """(exame, ex_type) do código no TUSS_INDEX (exato, senão a família) ou None."""
+    return TUSS_INDEX.lookup(cd_tuss) if cd_tuss else None
+
+def lookup_tuss_series(cd_tuss):
+    """Versão vetorizada de lookup_tuss: Series de (exame, ex_type) ou None, alinhada à entrada."""
+    import numpy as np
+    import pandas as pd  # Import local: só o caminho em lote depende do pandas
+
+    codes = pd.to_numeric(cd_tuss, errors="coerce")
+    valid = np.flatnonzero(codes.notna().to_numpy())
+    found = TUSS_INDEX.lookup_array(codes.to_numpy()[valid])
+    labels = np.empty(len(TUSS_INDEX.labels), dtype=object)
+    for i, label in enumerate(TUSS_INDEX.labels):
+        labels[i] = label
+    result = np.full(len(codes), None, dtype=object)
+    hit = found >= 0
+    result[valid[hit]] = labels[found[hit]]
+    return pd.Series(result, index=cd_tuss.index, dtype=object)
+
 # Regex para texto não estruturado: (regex, exame_final, ex_type)
 EXAM_PATTERNS = [
     (r'(ressonancia|ressonnancia|ressonância|rm|ressonfncia)', "Ressonância Magnética", "imagem"),
@@ -28,12 +64,50 @@ EXAM_PATTERNS = [
     (r'endoscop', "Endoscopia", "nao_imagem"),
 ]
 
+# Palavras-chave de cada padrão: {palavra: índice em EXAM_PATTERNS}.
+# Os padrões são alternações literais, ex.: r'(tomografia|tc)'.
+EXAM_KEYWORDS = {
+    word.replace("\\", ""): i
+    for i, (rgx, _, _) in enumerate(EXAM_PATTERNS)
+    for word in rgx.strip("()").split("|")
+}
+
+def _build_trie_regex(words):
+    """
+    Fatora as palavras em uma trie e gera uma única regex equivalente
+    (ex.: 'r(?:m|adiografia)'), que o motor do 're' percorre em uma só passada
+    sem testar cada alternativa em cada posição.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        if list(node) == [""]:
+            return ""
+        branches = [re.escape(ch) + build(node[ch]) for ch in sorted(k for k in node if k)]
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+# Automato único, compilado uma vez no import. Sem IGNORECASE: recebe sempre
+# o texto de normalize_text, já em minúsculas.
+EXAM_MATCHER = re.compile(_build_trie_regex(EXAM_KEYWORDS))
+
 # Termos que indicam "sem exame" ou "checkup"
 IGNORE_TERMS = {
     "sem exame", "exame não especificado", "apenas checkup",
     "sem exame adicional", "checkup geral", "apenas checkup geral"
 }
 
+STOPWORDS_RE = re.compile(r'\b(adicional|recomendada|programada|do|da|de)\b')
+
 def normalize_text(txt):
     """
     Normaliza texto para facilitar o match:
@@ -46,74 +120,150 @@ def normalize_text(txt):
     if not txt:
         return ""
     txt_lower = txt.lower()
-    if HAS_UNIDECODE:
-        txt_lower = unidecode(txt_lower)
-    txt_lower = re.sub(r'fncia', 'nancia', txt_lower)
-    txt_lower = re.sub(r'\b(adicional|recomendada|programada|do|da|de)\b', '', txt_lower)
-    txt_lower = re.sub(r'\s+', ' ', txt_lower).strip()
-    return txt_lower
+    if HAS_UNIDECODE and not txt_lower.isascii():
+        txt_lower = txt_lower.translate(ACCENT_TABLE)
+        if not txt_lower.isascii():
+            txt_lower = unidecode(txt_lower)
+    txt_lower = txt_lower.replace('fncia', 'nancia')
+    txt_lower = STOPWORDS_RE.sub('', txt_lower)
+    return " ".join(txt_lower.split())
+
+def match_exams(norm):
+    """
+    Percorre o texto normalizado uma única vez com EXAM_MATCHER e retorna
+    os índices de EXAM_PATTERNS encontrados, ordenados pela prioridade da lista.
+    """
+    return sorted({EXAM_KEYWORDS[m.group()] for m in EXAM_MATCHER.finditer(norm)})
+
+# Versão das regras: muda sozinha quando TUSS_EXAMS, EXAM_PATTERNS, IGNORE_TERMS
+# ou STOPWORDS_RE mudam (incrementar CLASSIFIER_REVISION ao alterar normalize_text),
+# invalidando o cache persistente de classificações.
+CLASSIFIER_REVISION = 1
+CLASSIFIER_VERSION = hashlib.sha1(repr((
+    CLASSIFIER_REVISION, sorted(TUSS_EXAMS.items()), EXAM_PATTERNS, sorted(IGNORE_TERMS), STOPWORDS_RE.pattern,
+)).encode("utf-8")).hexdigest()[:12]
+
+class ClassificationCache:
+    """
+    LRU limitado {texto: exames classificados}, seguro entre threads.
+    get() conta acertos e faltas (hit_ratio); peek() e 'in' não contam.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+            return value
+
+    def peek(self, key):
+        return self._data.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+CLASSIFICATION_CACHE = ClassificationCache(CLASSIFY_CACHE_SIZE)
+
+def text_hash(txt):
+    """Chave do texto no cache persistente (sha1 do texto original)."""
+    return hashlib.sha1(txt.encode("utf-8")).hexdigest()
+
+def classify_text(txt, cache=CLASSIFICATION_CACHE):
+    """
+    Classifica um texto livre (passos 2 e 3 de classify_exams) e retorna uma
+    tupla de (exame, ex_type). Cada texto distinto é normalizado e casado uma
+    única vez enquanto estiver no 'cache' (None = sem cache).
+    """
+    result = cache.get(txt) if cache is not None else None
+    if result is None:
+        norm = normalize_text(txt)
+        if not norm or norm in IGNORE_TERMS:
+            result = (("Sem Exame", "nao_imagem"),)
+        else:
+            hits = match_exams(norm)
+            result = tuple(EXAM_PATTERNS[i][1:] for i in hits) if hits else ((norm.title(), "nao_imagem"),)
+        if cache is not None:
+            cache.put(txt, result)
+    return result
+
+def classify_exams(cd_tuss, ds_receita):
+    """
+    Igual a classify_exam, mas retorna todos os exames encontrados:
+    1) Se cd_tuss estiver no TUSS_INDEX [(exame, ex_type)]
+    2) Caso contrário normaliza ds_receita e retorna um item por padrão casado
+    3) Se nada encontrado = [("Sem Exame", ...)] ou o próprio texto normalizado
+    """
+    exam = lookup_tuss(cd_tuss)
+    if exam is not None:
+        return [exam]
+    return list(classify_text(ds_receita or ""))
 
 def classify_exam(cd_tuss, ds_receita):
     """
-    1) Se cd_tuss estiver em TUSS_EXAMS (exame, ex_type)
+    1) Se cd_tuss estiver no TUSS_INDEX (exame, ex_type)
     2) Caso contrário  normaliza ds_receita e casa com EXAM_PATTERNS
     3) Se nada encontrado = "Sem Exame"
+    Retorna apenas o primeiro exame (ordem de EXAM_PATTERNS); ver classify_exams.
+    """
+    return classify_exams(cd_tuss, ds_receita)[0]
+
+def classify_exams_batch(cd_tuss, ds_receita):
+    """
+    Classifica um chunk inteiro de uma vez (mesmas regras de classify_exams):
+    1) cd_tuss resolvido no TUSS_INDEX de forma vetorizada (busca binária)
+    2) Demais linhas: cada texto distinto passa uma única vez por classify_text
+       (e só é normalizado/casado se não estiver em CLASSIFICATION_CACHE)
+    3) Retorna DataFrame com colunas ('exame', 'ex_type') alinhado ao índice
+       da entrada; linhas com mais de um exame repetem o índice.
     """
-    if cd_tuss and cd_tuss in TUSS_EXAMS:
-        return TUSS_EXAMS[cd_tuss]
-    norm = normalize_text(ds_receita)
-    if not norm or norm in IGNORE_TERMS:
-        return ("Sem Exame", "nao_imagem")
-    for (rgx, exame_final, ex_type) in EXAM_PATTERNS:
-        if re.search(rgx, norm, re.IGNORECASE):
-            return (exame_final, ex_type)
-    return (norm.title(), "nao_imagem")
+    import pandas as pd  # Import local: só o caminho em lote depende do pandas
+
+    tuss = lookup_tuss_series(cd_tuss)
+    from_tuss = tuss.notna()
+    exams = tuss[from_tuss].map(lambda exam: [exam])
+
+    texts = ds_receita[~from_tuss].fillna("").astype(str)
+    uniq = texts.unique()
+    results = [classify_text(txt) for txt in uniq]
+    exams = pd.concat([exams, texts.map(dict(zip(uniq, results)))]).reindex(cd_tuss.index)
+
+    exploded = exams.explode()
+    return pd.DataFrame(exploded.tolist(), index=exploded.index, columns=["exame", "ex_type"])
 
 def build_message_for_exams(client_name, exam_list):
     """
     Recebe exam_list = [(exame, ex_type), ...].
-    Deduplica, remove "Sem Exame" e IGNORE_TERMS, e formata a mensagem.
-    """
-    from config.settings import PLATFORM_LINK, COMPANY_NAME  # Import local para evitar dependência circular
-    unique_img = set()
-    unique_nonimg = set()
-
-    for (exame, ex_type) in exam_list:
-        ex_lower = exame.lower()
-        if ex_lower in IGNORE_TERMS or ex_lower.startswith("sem exame"):
-            continue
-        if ex_type == "imagem":
-            unique_img.add(exame)
-        else:
-            unique_nonimg.add(exame)
-
-    img_list = sorted(unique_img)
-    nonimg_list = sorted(unique_nonimg)
-
-    lines = []
-    lines.append(f"Olá {client_name},")
-    lines.append("")
-    lines.append("Identificamos que você tem alguns exames pendentes:")
-    lines.append("")
-
-    bullet_lines = []
-    for item in img_list:
-        bullet_lines.append(f"• {item}")
-    for item in nonimg_list:
-        bullet_lines.append(f"• {item}")
-
-    if bullet_lines:
-        lines.extend(bullet_lines)
-    else:
-        lines.append("• Nenhum exame específico identificado.")
-
-    lines.append("")
-    lines.append("É fundamental agendar o quanto antes para garantir sua saúde em dia.")
-    lines.append(f"Agende facilmente pelo link: {PLATFORM_LINK}")
-    lines.append("")
-    lines.append(f"Caso precise de suporte, a equipe {COMPANY_NAME} está aqui para ajudar.")
-    lines.append("")
-    lines.append("Um abraço,")
-    lines.append(f"Equipe {COMPANY_NAME}")
-
-    return "\n".join(lines)
+    Deduplica, remove "Sem Exame" e IGNORE_TERMS, e formata a mensagem
+    com o template compilado (ver domain/message_templates.py).
+    """
+    from domain.message_templates import render_message  # Import local para evitar dependência circular
+    return render_message(client_name, exam_list)
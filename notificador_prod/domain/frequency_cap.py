@@ -0,0 +1,98 @@
+import re
+import bisect
+import threading
+from array import array
+from itertools import compress
+
+NON_DIGITS_RE = re.compile(r"\D")
+MAX_PENDING = 65536  # inserções recentes fora dos arrays (limita o dict e o pico do merge)
+
+def phone_key(tel):
+    """Telefone como inteiro (só os dígitos), chave de RecentlyNotified; None se não houver dígitos."""
+    tel = str(tel)
+    digits = tel if tel.isdigit() else NON_DIGITS_RE.sub("", tel)
+    return int(digits) if digits else None
+
+class RecentlyNotified:
+    """
+    Telefones notificados recentemente e o horário do último envio, em pouca memória:
+    1) Base: telefones em um array int64 ordenado (busca binária) e o horário
+       (epoch em segundos) em um array uint32 paralelo: 12 bytes por telefone,
+       ~12 MB para 1 milhão.
+    2) Inserções recentes vão para um dict pequeno e são incorporadas à base
+       quando ele passa de 1/8 da base ou de MAX_PENDING (a consulta olha os dois).
+    3) prune() descarta os envios mais antigos que a janela.
+    Thread-safe (envios e marcações podem vir de estágios diferentes do pipeline).
+    """
+
+    def __init__(self):
+        self._phones = array("q")
+        self._times = array("I")
+        self._delta = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._phones) + sum(1 for p in self._delta if self._find(p) is None)
+
+    @property
+    def nbytes(self):
+        """Memória dos arrays da base (o dict de inserções recentes é limitado a MAX_PENDING)."""
+        return self._phones.itemsize * len(self._phones) + self._times.itemsize * len(self._times)
+
+    def _find(self, phone):
+        i = bisect.bisect_left(self._phones, phone)
+        if i < len(self._phones) and self._phones[i] == phone:
+            return i
+        return None
+
+    def last_notified(self, tel):
+        """Epoch (s) do último envio registrado para o telefone, ou None."""
+        phone = phone_key(tel)
+        if phone is None:
+            return None
+        with self._lock:
+            ts = self._delta.get(phone)
+            i = self._find(phone)
+            if i is not None and (ts is None or self._times[i] > ts):
+                ts = self._times[i]
+            return ts
+
+    def add_many(self, entries):
+        """Registra envios [(tel, epoch)], mantendo o horário mais recente de cada telefone."""
+        with self._lock:
+            for tel, ts in entries:
+                phone = phone_key(tel)
+                if phone is not None and ts > self._delta.get(phone, -1):
+                    self._delta[phone] = int(ts)
+            if len(self._delta) > min(MAX_PENDING, max(1024, len(self._phones) // 8)):
+                self._merge()
+
+    def prune(self, cutoff):
+        """Remove os envios anteriores a 'cutoff' (epoch) e incorpora as inserções recentes."""
+        with self._lock:
+            self._merge(cutoff)
+
+    def _merge(self, cutoff=0):
+        """Intercala as inserções recentes (ordenadas) na base, copiando os trechos entre elas em bloco."""
+        old_phones, old_times = self._phones, self._times
+        phones, times = array("q"), array("I")
+        i = 0
+        for phone, ts in sorted(self._delta.items()):
+            j = bisect.bisect_left(old_phones, phone, i)
+            phones.extend(old_phones[i:j])
+            times.extend(old_times[i:j])
+            if j < len(old_phones) and old_phones[j] == phone:
+                ts = max(ts, old_times[j])
+                j += 1
+            phones.append(phone)
+            times.append(ts)
+            i = j
+        phones.extend(old_phones[i:])
+        times.extend(old_times[i:])
+        if cutoff:
+            if min(times, default=cutoff) < cutoff:
+                phones = array("q", compress(phones, (ts >= cutoff for ts in times)))
+                times = array("I", (ts for ts in times if ts >= cutoff))
+        self._phones, self._times = phones, times
+        self._delta = {}
@@ -0,0 +1,91 @@
+import re
+import hashlib
+import logging
+from functools import lru_cache
+from config.settings import COMPANY_NAME, PLATFORM_LINK, MESSAGE_TEMPLATE_FILE, MESSAGE_CACHE_SIZE
+from domain.exam_utils import IGNORE_TERMS
+
+logger = logging.getLogger("notifier")
+
+DEFAULT_TEMPLATE = "\n".join([
+    "Olá {client_name},",
+    "",
+    "Identificamos que você tem alguns exames pendentes:",
+    "",
+    "{exams}",
+    "",
+    "É fundamental agendar o quanto antes para garantir sua saúde em dia.",
+    "Agende facilmente pelo link: {platform_link}",
+    "",
+    "Caso precise de suporte, a equipe {company_name} está aqui para ajudar.",
+    "",
+    "Um abraço,",
+    "Equipe {company_name}",
+])
+
+_PLACEHOLDERS = re.compile(r"(\{client_name\}|\{exams\})")
+
+class MessageTemplate:
+    """
+    Template compilado uma única vez:
+    1) {company_name} e {platform_link} são substituídos na compilação.
+    2) O texto é quebrado em partes fixas e nos campos dinâmicos
+       ({client_name}, {exams}), então renderizar é só concatenar.
+    3) O bloco de exames vem de exam_bullets (cache LRU por conjunto de exames).
+    """
+
+    def __init__(self, text, company_name=COMPANY_NAME, platform_link=PLATFORM_LINK):
+        self.version = hashlib.sha1(text.encode("utf-8")).hexdigest()[:8]
+        static = text.replace("{company_name}", str(company_name)).replace("{platform_link}", str(platform_link))
+        self.parts = _PLACEHOLDERS.split(static)
+
+    def render(self, client_name, exam_list):
+        # solicitante é anulável: None/NaN (agregação "first" sem valor) viram nome vazio
+        client_name = "" if client_name is None or client_name != client_name else str(client_name)
+        bullets = exam_bullets(frozenset(exam_list))
+        return "".join(
+            client_name if part == "{client_name}" else bullets if part == "{exams}" else part
+            for part in self.parts
+        )
+
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def exam_bullets(exams):
+    """
+    Recebe o conjunto congelado de (exame, ex_type).
+    Remove "Sem Exame" e IGNORE_TERMS e monta as linhas "• exame"
+    (imagem primeiro, cada grupo em ordem alfabética).
+    """
+    unique_img = set()
+    unique_nonimg = set()
+
+    for (exame, ex_type) in exams:
+        ex_lower = exame.lower()
+        if ex_lower in IGNORE_TERMS or ex_lower.startswith("sem exame"):
+            continue
+        if ex_type == "imagem":
+            unique_img.add(exame)
+        else:
+            unique_nonimg.add(exame)
+
+    bullet_lines = [f"• {item}" for item in sorted(unique_img) + sorted(unique_nonimg)]
+    return "\n".join(bullet_lines) if bullet_lines else "• Nenhum exame específico identificado."
+
+def load_template(path=None, **kwargs):
+    """Compila o template do arquivo 'path' (UTF-8) ou o DEFAULT_TEMPLATE."""
+    if path:
+        with open(path, encoding="utf-8") as f:
+            text = f.read().rstrip("\n")
+    else:
+        text = DEFAULT_TEMPLATE
+    template = MessageTemplate(text, **kwargs)
+    logger.info(f"Template de mensagem carregado ({path or 'padrão'}, versão {template.version}).")
+    return template
+
+_default_template = None
+
+def render_message(client_name, exam_list):
+    """Renderiza com o template padrão (MESSAGE_TEMPLATE_FILE), compilado no primeiro uso."""
+    global _default_template
+    if _default_template is None:
+        _default_template = load_template(MESSAGE_TEMPLATE_FILE)
+    return _default_template.render(client_name, exam_list)
@@ -0,0 +1,183 @@
+import csv
+import json
+import mmap
+import time
+import bisect
+import struct
+import logging
+from array import array
+
+logger = logging.getLogger("notifier")
+
+TUSS_CODE_DIGITS = 8
+_MAGIC = b"TUSSIDX1"
+_HEADER = struct.Struct("<8sQQQ")  # magic, códigos, faixas, bytes dos rótulos (JSON)
+
+def parse_code_spec(spec):
+    """
+    Converte a coluna 'codigo' do CSV em (início, fim):
+    - "40901114"            -> código exato (início == fim)
+    - "40900000-40999999"   -> faixa
+    - "409*"                -> família pelo prefixo (40900000-40999999)
+    """
+    spec = spec.strip()
+    if spec.endswith("*"):
+        prefix = spec[:-1]
+        scale = 10 ** (TUSS_CODE_DIGITS - len(prefix))
+        return int(prefix) * scale, (int(prefix) + 1) * scale - 1
+    if "-" in spec:
+        start, end = spec.split("-", 1)
+        return int(start), int(end)
+    return int(spec), int(spec)
+
+def _flatten_ranges(ranges):
+    """
+    Transforma faixas possivelmente aninhadas em segmentos disjuntos e
+    ordenados, em que vale a faixa mais estreita (a subfamília vence a família).
+    """
+    points = sorted({start for start, _, _ in ranges} | {end + 1 for _, end, _ in ranges})
+    segments = []
+    for lo, hi in zip(points, points[1:]):
+        containing = [(end - start, label) for start, end, label in ranges if start <= lo and hi - 1 <= end]
+        if not containing:
+            continue
+        label = min(containing)[1]
+        if segments and segments[-1][2] == label and segments[-1][1] == lo - 1:
+            segments[-1] = (segments[-1][0], hi - 1, label)
+        else:
+            segments.append((lo, hi - 1, label))
+    return segments
+
+class TussIndex:
+    """
+    Índice compacto da terminologia TUSS:
+    1) Códigos exatos em um array int64 ordenado (busca binária) e o rótulo
+       (exame, ex_type) de cada um como índice em uma lista sem repetições.
+    2) Famílias/faixas de códigos como segmentos disjuntos (início, fim) ordenados:
+       código sem entrada exata cai na faixa mais específica que o contém.
+    3) save()/load_tuss_index(): formato binário carregado via mmap, sem parse.
+    """
+
+    def __init__(self, codes, code_labels, starts, ends, range_labels, labels):
+        self.codes = codes
+        self.code_labels = code_labels
+        self.starts = starts
+        self.ends = ends
+        self.range_labels = range_labels
+        self.labels = labels
+
+    @classmethod
+    def build(cls, exact, ranges=()):
+        """Monta o índice a partir de {código: (exame, ex_type)} e [(início, fim, (exame, ex_type))]."""
+        labels, label_ids = [], {}
+
+        def label_id(label):
+            label = tuple(label)
+            if label not in label_ids:
+                label_ids[label] = len(labels)
+                labels.append(label)
+            return label_ids[label]
+
+        codes = sorted(exact)
+        segments = _flatten_ranges([(start, end, label_id(label)) for start, end, label in ranges])
+        return cls(
+            array("q", codes), array("i", (label_id(exact[c]) for c in codes)),
+            array("q", (s[0] for s in segments)), array("q", (s[1] for s in segments)),
+            array("i", (s[2] for s in segments)), labels,
+        )
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lookup(self, code):
+        """(exame, ex_type) do código (exato, senão a faixa) ou None."""
+        try:
+            code = int(code)
+        except (TypeError, ValueError):
+            return None
+        i = bisect.bisect_left(self.codes, code)
+        if i < len(self.codes) and self.codes[i] == code:
+            return self.labels[self.code_labels[i]]
+        j = bisect.bisect_right(self.starts, code) - 1
+        if j >= 0 and code <= self.ends[j]:
+            return self.labels[self.range_labels[j]]
+        return None
+
+    def lookup_array(self, values):
+        """Versão vetorizada (numpy) de lookup: índice em self.labels por código, -1 se não encontrado."""
+        import numpy as np  # Import local: só o caminho em lote usa numpy
+
+        values = np.asarray(values, dtype=np.int64)
+        found = np.full(len(values), -1, dtype=np.int64)
+        codes = np.frombuffer(self.codes, dtype=np.int64)
+        if len(codes):
+            i = np.minimum(np.searchsorted(codes, values), len(codes) - 1)
+            hit = codes[i] == values
+            found[hit] = np.frombuffer(self.code_labels, dtype=np.int32)[i[hit]]
+        starts = np.frombuffer(self.starts, dtype=np.int64)
+        if len(starts):
+            j = np.searchsorted(starts, values, side="right") - 1
+            jc = np.maximum(j, 0)
+            in_range = (found < 0) & (j >= 0) & (values <= np.frombuffer(self.ends, dtype=np.int64)[jc])
+            found[in_range] = np.frombuffer(self.range_labels, dtype=np.int32)[jc[in_range]]
+        return found
+
+    def save(self, path):
+        """Grava o formato binário (arrays int64, depois int32, depois os rótulos em JSON)."""
+        labels = json.dumps(self.labels, ensure_ascii=False).encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(self.codes), len(self.starts), len(labels)))
+            for arr, typecode in ((self.codes, "q"), (self.starts, "q"), (self.ends, "q"),
+                                  (self.code_labels, "i"), (self.range_labels, "i")):
+                f.write(array(typecode, arr).tobytes())
+            f.write(labels)
+
+def read_tuss_csv(path):
+    """
+    Lê a terminologia em CSV (colunas 'codigo', 'exame' e opcionalmente 'ex_type',
+    padrão "nao_imagem"). Retorna ({código: rótulo}, [(início, fim, rótulo)]).
+    """
+    exact, ranges = {}, []
+    with open(path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+            label = (row["exame"], row.get("ex_type") or "nao_imagem")
+            start, end = parse_code_spec(row["codigo"])
+            if start == end:
+                exact[start] = label
+            else:
+                ranges.append((start, end, label))
+    return exact, ranges
+
+def _map_index(path):
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, n_codes, n_ranges, n_labels = _HEADER.unpack_from(buf)
+    if magic != _MAGIC:
+        raise ValueError(f"{path} não é um índice TUSS compilado.")
+    view = memoryview(buf)
+    offset = _HEADER.size
+    arrays = []
+    for count, typecode, size in ((n_codes, "q", 8), (n_ranges, "q", 8), (n_ranges, "q", 8),
+                                  (n_codes, "i", 4), (n_ranges, "i", 4)):
+        arrays.append(view[offset:offset + count * size].cast("B").cast(typecode))
+        offset += count * size
+    codes, starts, ends, code_labels, range_labels = arrays
+    labels = [tuple(label) for label in json.loads(bytes(view[offset:offset + n_labels]).decode("utf-8"))]
+    return TussIndex(codes, code_labels, starts, ends, range_labels, labels)
+
+def load_tuss_index(path, base=None):
+    """
+    Carrega o índice de 'path': binário de TussIndex.save() (.bin, via mmap)
+    ou CSV da terminologia. 'base' ({código: rótulo}) entra nos códigos exatos
+    do CSV sem sobrescrever as entradas do arquivo.
+    """
+    started = time.perf_counter()
+    if path.endswith(".bin"):
+        index = _map_index(path)
+    else:
+        exact, ranges = read_tuss_csv(path)
+        index = TussIndex.build({**(base or {}), **exact}, ranges)
+    logger.info(f"Índice TUSS carregado de {path}: {len(index)} códigos, {len(index.starts)} faixas "
+                f"({(time.perf_counter() - started) * 1000:.1f} ms).")
+    return index
@@ -1,17 +1,605 @@
+import os
+import json
+import select
+import logging
+import threading
 from sqlalchemy import create_engine, text
-from config.settings import DATABASE_URL
+from config.settings import DATABASE_URL, NOTIFY_CHANNEL
+from infrastructure.metrics import timed
 
-# Conexão com o Banco de Dados
-engine = create_engine(DATABASE_URL)
+logger = logging.getLogger("notifier")
 
-def mark_as_notified_by_tel(conn, tel):
+def create_db_engine(url, pool_size=None):
+    """Cria um engine; com 'pool_size', o pool fica limitado a esse número de conexões."""
+    if pool_size is None:
+        return create_engine(url)
+    return create_engine(url, pool_size=pool_size, max_overflow=0, pool_pre_ping=True)
+
+# Conexão com o Banco de Dados, criada no primeiro uso (no modo multi-tenant
+# cada tenant tem o seu engine e este nunca é criado)
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Retorna o engine de DATABASE_URL (criado uma única vez)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_db_engine(DATABASE_URL)
+    return _engine
+
+NOTIFY_TABLES = ["dados_estruturados", "dados_nao_estruturados"]
+
+# Reserva de telefones por worker (uma linha por telefone em processamento)
+LEASE_TABLE_DDL = (
+    "CREATE TABLE IF NOT EXISTS public.notification_leases ("
+    "tel text PRIMARY KEY, "
+    "worker_id text NOT NULL, "
+    "lease_until timestamptz NOT NULL)"
+)
+
+# Outbox de reenvio: estado de falha por telefone (status 'retry' ou 'dead')
+OUTBOX_TABLE_DDL = (
+    "CREATE TABLE IF NOT EXISTS public.notification_outbox ("
+    "tel text PRIMARY KEY, "
+    "attempts integer NOT NULL DEFAULT 0, "
+    "last_error text, "
+    "next_attempt_at timestamptz NOT NULL, "
+    "status text NOT NULL DEFAULT 'retry', "
+    "updated_at timestamptz NOT NULL DEFAULT now())"
+)
+
+# Cache persistente de classificação: sha1 do texto + versão das regras -> exames
+CLASSIFICATION_CACHE_DDL = (
+    "CREATE TABLE IF NOT EXISTS public.notification_classification_cache ("
+    "text_hash text NOT NULL, "
+    "classifier_version text NOT NULL, "
+    "result jsonb NOT NULL, "
+    "created_at timestamptz NOT NULL DEFAULT now(), "
+    "PRIMARY KEY (text_hash, classifier_version))"
+)
+
+# Último envio por telefone (limite de frequência, FREQUENCY_CAP_SECONDS)
+RECENT_NOTIFICATIONS_DDL = [
+    "CREATE TABLE IF NOT EXISTS public.notification_recent ("
+    "tel text PRIMARY KEY, "
+    "notified_at timestamptz NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS notification_recent_notified_at_idx "
+    "ON public.notification_recent (notified_at)",
+]
+
+# Envios do dia da conta (escalonador por prioridade), compartilhados entre réplicas
+DAILY_SENDS_DDL = (
+    "CREATE TABLE IF NOT EXISTS public.notification_daily_sends ("
+    "day date PRIMARY KEY, "
+    "sent integer NOT NULL DEFAULT 0, "
+    "exhausted boolean NOT NULL DEFAULT false)"
+)
+
+def ensure_service_tables(conn):
+    """Cria as tabelas de controle do serviço (reservas, outbox, cache, últimos envios e envios do dia), se não existirem."""
+    conn.execute(text(LEASE_TABLE_DDL))
+    conn.execute(text(OUTBOX_TABLE_DDL))
+    conn.execute(text(CLASSIFICATION_CACHE_DDL))
+    conn.execute(text(DAILY_SENDS_DDL))
+    for ddl in RECENT_NOTIFICATIONS_DDL:
+        conn.execute(text(ddl))
+    conn.commit()
+
+# Telefone d.tel sem reserva válida e fora da outbox (reenvio ou retenção do dead-letter não vencidos)
+AVAILABLE_TEL_FILTER = (
+    "NOT EXISTS ("
+    "SELECT 1 FROM public.notification_leases l "
+    "WHERE l.tel = d.tel AND l.lease_until > now()) "
+    "AND NOT EXISTS ("
+    "SELECT 1 FROM public.notification_outbox o "
+    "WHERE o.tel = d.tel AND o.next_attempt_at > now())"
+)
+
+@timed("notifier_db_seconds", op="claim")
+def claim_pending_tels(conn, worker_id, limit, lease_seconds):
     """
-    Marca todos os registros (notified=false) para esse telefone
-    em 'dados_estruturados' e 'dados_nao_estruturados' como notified=true.
+    Reserva atomicamente um lote de telefones pendentes para este worker:
+    1) Lê até 'limit' registros pendentes de cada tabela, ignorando telefones
+       com reserva válida ou na outbox (reenvio ou retenção do dead-letter não vencidos),
+       com FOR UPDATE SKIP LOCKED (workers concorrentes pulam as linhas uns dos outros).
+    2) Insere/renova a reserva de cada telefone, em ordem de tel (workers
+       concorrentes travam as reservas na mesma ordem); reservas expiradas
+       (worker que caiu ou não renovou) são retomadas, reservas válidas de outro worker não.
+    3) Retorna a lista de telefones efetivamente reservados.
+    """
+    pending = (
+        "SELECT d.tel FROM public.{tbl} d "
+        "WHERE NOT d.notified AND " + AVAILABLE_TEL_FILTER + " "
+        "ORDER BY d.id LIMIT :lim FOR UPDATE OF d SKIP LOCKED"
+    )
+    result = conn.execute(
+        text(
+            f"WITH c1 AS ({pending.format(tbl=NOTIFY_TABLES[0])}), "
+            f"c2 AS ({pending.format(tbl=NOTIFY_TABLES[1])}) "
+            "INSERT INTO public.notification_leases (tel, worker_id, lease_until) "
+            "SELECT tel, :worker, now() + make_interval(secs => :secs) "
+            "FROM (SELECT tel FROM c1 UNION SELECT tel FROM c2) t "
+            "ORDER BY tel "  # mesma ordem de inserção em todos os workers: sem deadlock entre reservas
+            "ON CONFLICT (tel) DO UPDATE "
+            "SET worker_id = EXCLUDED.worker_id, lease_until = EXCLUDED.lease_until "
+            "WHERE notification_leases.lease_until <= now() "
+            "RETURNING tel"
+        ),
+        {"lim": limit, "worker": worker_id, "secs": lease_seconds}
+    )
+    tels = [row[0] for row in result]
+    conn.commit()
+    return tels
+
+@timed("notifier_db_seconds", op="claim")
+def claim_tels(conn, worker_id, tels, lease_seconds):
+    """
+    Reserva os telefones informados (escolhidos pelo escalonador por prioridade),
+    com as mesmas regras de claim_pending_tels: pula reservas válidas de outro
+    worker e telefones na outbox. Retorna os telefones efetivamente reservados.
+    """
+    tels = list(tels)
+    if not tels:
+        return []
+    result = conn.execute(
+        text(
+            "INSERT INTO public.notification_leases (tel, worker_id, lease_until) "
+            "SELECT d.tel, :worker, now() + make_interval(secs => :secs) "
+            "FROM unnest(CAST(:tels AS text[])) AS d(tel) "
+            "WHERE NOT EXISTS ("
+            "SELECT 1 FROM public.notification_outbox o "
+            "WHERE o.tel = d.tel AND o.next_attempt_at > now()) "
+            "ORDER BY d.tel "
+            "ON CONFLICT (tel) DO UPDATE "
+            "SET worker_id = EXCLUDED.worker_id, lease_until = EXCLUDED.lease_until "
+            "WHERE notification_leases.lease_until <= now() "
+            "RETURNING tel"
+        ),
+        {"tels": tels, "worker": worker_id, "secs": lease_seconds}
+    )
+    claimed = {row[0] for row in result}
+    conn.commit()
+    return [tel for tel in tels if tel in claimed]
+
+@timed("notifier_db_seconds", op="scan")
+def scan_pending_tels(conn, cursors, limit):
+    """
+    Varredura incremental (escalonador por prioridade): telefones disponíveis
+    com registros pendentes de id maior que o cursor de cada tabela ({tabela: id}),
+    lendo no máximo 'limit' registros por tabela em ordem de id.
+    Retorna (telefones, novos cursores, fim): 'fim' se as duas tabelas acabaram.
     """
-    for tbl in ["dados_estruturados", "dados_nao_estruturados"]:
+    tels, new_cursors, done = [], dict(cursors), True
+    for tbl in NOTIFY_TABLES:
+        rows = conn.execute(
+            text(
+                f"SELECT d.id, d.tel FROM public.{tbl} d "
+                "WHERE NOT d.notified AND d.id > :after AND " + AVAILABLE_TEL_FILTER + " "
+                "ORDER BY d.id LIMIT :lim"
+            ),
+            {"after": cursors.get(tbl, -1), "lim": limit}
+        ).all()
+        if rows:
+            new_cursors[tbl] = rows[-1][0]
+        done = done and len(rows) < limit
+        tels.extend(tel for _, tel in rows)
+    conn.commit()
+    return list(dict.fromkeys(tels)), new_cursors, done
+
+@timed("notifier_db_seconds", op="renew")
+def renew_claims(conn, worker_id, tels, lease_seconds):
+    """
+    Prorroga por 'lease_seconds' as reservas deste worker para os telefones
+    informados. Retorna os telefones cuja reserva ainda era dele (os demais
+    foram retomados por outro worker depois de expirar).
+    """
+    tels = list(tels)
+    if not tels:
+        return []
+    result = conn.execute(
+        text(
+            "UPDATE public.notification_leases SET lease_until = now() + make_interval(secs => :secs) "
+            "WHERE worker_id = :worker AND tel = ANY(:tels) "
+            "RETURNING tel"
+        ),
+        {"tels": tels, "worker": worker_id, "secs": lease_seconds}
+    )
+    renewed = [row[0] for row in result]
+    conn.commit()
+    return renewed
+
+@timed("notifier_db_seconds", op="release")
+def release_claims(conn, worker_id, tels):
+    """Libera as reservas deste worker para os telefones informados."""
+    tels = list(tels)
+    if tels:
         conn.execute(
-            text(f"UPDATE public.{tbl} SET notified=true WHERE tel=:tel AND NOT notified"),
-            {"tel": tel}
+            text("DELETE FROM public.notification_leases WHERE tel = ANY(:tels) AND worker_id = :worker"),
+            {"tels": tels, "worker": worker_id}
         )
         conn.commit()
+
+@timed("notifier_db_seconds", op="copy")
+def copy_query_csv(conn, sql, params, parse):
+    """
+    Executa COPY (sql) TO STDOUT em CSV na conexão 'conn', a que o chamador já
+    tem (o pool de um tenant, sem overflow, pode não ter outra livre), e entrega
+    o fluxo a 'parse' (função que lê um arquivo binário) por um pipe: o CSV é
+    consumido enquanto chega, sem objetos Python por linha nem o resultado
+    inteiro em memória. 'sql' usa parâmetros do psycopg2 (%(nome)s), interpolados
+    por mogrify. Como numa consulta comum, o COMMIT fica com o chamador.
+    Retorna o que 'parse' retornar; erros do COPY são relançados.
+    """
+    if not conn.in_transaction():
+        conn.begin()  # O conn.commit() do chamador encerra também a transação do COPY
+    raw = conn.connection.dbapi_connection
+    read_fd, write_fd = os.pipe()
+    errors = []
+
+    def produce():
+        try:
+            with os.fdopen(write_fd, "wb") as out, raw.cursor() as cur:
+                query = cur.mogrify(sql, params).decode()
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", out)
+        except Exception as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce, name="copy", daemon=True)
+    producer.start()
+    try:
+        with os.fdopen(read_fd, "rb") as inp:
+            result = parse(inp)
+    finally:
+        producer.join()
+    if errors:
+        raise errors[0]
+    return result
+
+@timed("notifier_db_seconds", op="estimate")
+def estimate_pending_rows(conn):
+    """
+    Estimativa barata do backlog (linhas com notified=false nas duas tabelas),
+    lida do plano do EXPLAIN, sem varrer as tabelas.
+    """
+    total = 0
+    for tbl in NOTIFY_TABLES:
+        plan = conn.execute(
+            text(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM public.{tbl} WHERE NOT notified")
+        ).scalar()
+        total += int(plan[0]["Plan"]["Plan Rows"])
+    conn.rollback()
+    return total
+
+@timed("notifier_db_seconds", op="mark")
+def mark_as_notified_by_tels(conn, tels, record_recent=False, ids=None):
+    """
+    Marca em lote os registros (notified=false) dos telefones informados
+    em 'dados_estruturados' e 'dados_nao_estruturados' como notified=true.
+    - Com 'ids' ({tabela: [id]}, os registros lidos para a mensagem), marca só
+      esses: registros que chegaram depois da leitura continuam pendentes.
+      Sem 'ids', marca todos os pendentes dos telefones.
+    - Um UPDATE por tabela e um único COMMIT.
+    - Na mesma transação remove esses telefones da outbox de reenvio e, com
+      'record_recent', grava o horário do envio em notification_recent.
+    - Retorna {tabela: linhas afetadas}.
+    """
+    tels = list(tels)
+    if not tels:
+        return {tbl: 0 for tbl in NOTIFY_TABLES}
+    counts = {}
+    for tbl in NOTIFY_TABLES:
+        if ids is None:
+            result = conn.execute(
+                text(f"UPDATE public.{tbl} SET notified=true WHERE tel = ANY(:tels) AND NOT notified"),
+                {"tels": tels}
+            )
+        elif ids.get(tbl):
+            result = conn.execute(
+                text(f"UPDATE public.{tbl} SET notified=true WHERE id = ANY(:ids) AND NOT notified"),
+                {"ids": ids[tbl]}
+            )
+        else:
+            counts[tbl] = 0
+            continue
+        counts[tbl] = result.rowcount
+    conn.execute(text("DELETE FROM public.notification_outbox WHERE tel = ANY(:tels)"), {"tels": tels})
+    if record_recent:
+        conn.execute(
+            text(
+                "INSERT INTO public.notification_recent (tel, notified_at) "
+                "SELECT DISTINCT unnest(CAST(:tels AS text[])), now() "
+                "ON CONFLICT (tel) DO UPDATE SET notified_at = EXCLUDED.notified_at"
+            ),
+            {"tels": tels}
+        )
+    conn.commit()
+    return counts
+
+def load_recent_notifications(conn, since, batch=50000):
+    """
+    Lê de notification_recent os envios a partir de 'since' (epoch em segundos),
+    em lotes de até 'batch' linhas [(tel, epoch)] (gerador, sem materializar tudo).
+    """
+    result = conn.execute(
+        text(
+            "SELECT tel, CAST(extract(epoch FROM notified_at) AS bigint) "
+            "FROM public.notification_recent WHERE notified_at >= to_timestamp(:since)"
+        ).execution_options(yield_per=batch),
+        {"since": since}
+    )
+    for rows in result.partitions():
+        yield rows
+    conn.commit()
+
+@timed("notifier_db_seconds", op="recent_prune")
+def prune_recent_notifications(conn, window_seconds):
+    """Remove de notification_recent os envios mais antigos que a janela. Retorna quantos."""
+    result = conn.execute(
+        text("DELETE FROM public.notification_recent "
+             "WHERE notified_at < now() - make_interval(secs => :secs)"),
+        {"secs": window_seconds}
+    )
+    conn.commit()
+    return result.rowcount
+
+@timed("notifier_db_seconds", op="outbox")
+def defer_tels(conn, delays, reason):
+    """
+    Adia telefones sem contar tentativa ({tel: segundos}): entram na outbox com
+    status 'retry' até o prazo, e claim_pending_tels/claim_tels os pulam até lá.
+    Um adiamento mais longo já existente é mantido.
+    """
+    if not delays:
+        return
+    tels = list(delays)
+    conn.execute(
+        text(
+            "INSERT INTO public.notification_outbox AS o "
+            "(tel, attempts, last_error, next_attempt_at, status, updated_at) "
+            "SELECT t.tel, 0, :reason, now() + make_interval(secs => t.secs), 'retry', now() "
+            "FROM unnest(CAST(:tels AS text[]), CAST(:secs AS double precision[])) AS t(tel, secs) "
+            "ON CONFLICT (tel) DO UPDATE SET "
+            "last_error = EXCLUDED.last_error, "
+            "next_attempt_at = GREATEST(o.next_attempt_at, EXCLUDED.next_attempt_at), "
+            "updated_at = now()"
+        ),
+        {"tels": tels, "secs": [float(delays[tel]) for tel in tels], "reason": reason}
+    )
+    conn.commit()
+
+@timed("notifier_db_seconds", op="outbox")
+def outbox_released_since(conn, since):
+    """
+    True se algum telefone adiado na outbox (reenvio ou limite de frequência)
+    voltou a ficar disponível depois de 'since' (epoch): a varredura iniciada
+    em 'since' o pulou e ele precisa de uma nova.
+    """
+    released = conn.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM public.notification_outbox "
+            "WHERE next_attempt_at > to_timestamp(:since) "
+            "AND next_attempt_at <= now())"
+        ),
+        {"since": since}
+    ).scalar()
+    conn.commit()
+    return bool(released)
+
+@timed("notifier_db_seconds", op="outbox")
+def record_send_failures(conn, failures, max_attempts, base_delay, max_delay, dead_retention):
+    """
+    Registra na outbox as falhas de envio {tel: (erro, conta_tentativa, adiamento)}:
+    1) Falha que conta tentativa (erro do destinatário): attempts+1 e próxima
+       tentativa em base_delay * 2^(attempts-1) segundos (limitado a max_delay).
+    2) Falha que não conta (limite diário, erro passageiro do provedor/rede):
+       só adia 'adiamento' segundos, mantendo attempts e status.
+    3) Ao atingir max_attempts o telefone vai para dead-letter (status='dead')
+       por 'dead_retention' segundos; depois disso volta a ser tentado uma vez
+       (nova falha do destinatário o devolve ao dead-letter).
+    Retorna {status: quantidade de telefones}.
+    """
+    if not failures:
+        return {}
+    tels = list(failures)
+    result = conn.execute(
+        text(
+            "INSERT INTO public.notification_outbox AS o "
+            "(tel, attempts, last_error, next_attempt_at, status, updated_at) "
+            "SELECT t.tel, CASE WHEN t.counts THEN 1 ELSE 0 END, t.err, "
+            "now() + make_interval(secs => CASE WHEN NOT t.counts THEN t.delay "
+            "WHEN 1 >= :max THEN :retention ELSE :base END), "
+            "CASE WHEN t.counts AND 1 >= :max THEN 'dead' ELSE 'retry' END, now() "
+            "FROM unnest(CAST(:tels AS text[]), CAST(:errs AS text[]), CAST(:counts AS boolean[]), "
+            "CAST(:delays AS double precision[])) AS t(tel, err, counts, delay) "
+            "ON CONFLICT (tel) DO UPDATE SET "
+            "attempts = o.attempts + EXCLUDED.attempts, "
+            "last_error = EXCLUDED.last_error, "
+            "next_attempt_at = CASE WHEN EXCLUDED.attempts = 0 THEN EXCLUDED.next_attempt_at "
+            "WHEN o.attempts + 1 >= :max THEN now() + make_interval(secs => :retention) "
+            "ELSE now() + make_interval(secs => LEAST(:base * power(2, o.attempts), :max_delay)) END, "
+            "status = CASE WHEN EXCLUDED.attempts = 0 THEN o.status "
+            "WHEN o.attempts + 1 >= :max THEN 'dead' ELSE 'retry' END, "
+            "updated_at = now() "
+            "RETURNING status"
+        ),
+        {
+            "tels": tels,
+            "errs": [failures[tel][0] for tel in tels],
+            "counts": [failures[tel][1] for tel in tels],
+            "delays": [float(failures[tel][2]) for tel in tels],
+            "base": base_delay, "max_delay": max_delay, "max": max_attempts, "retention": dead_retention,
+        }
+    )
+    statuses = {}
+    for (status,) in result:
+        statuses[status] = statuses.get(status, 0) + 1
+    conn.commit()
+    return statuses
+
+def requeue_dead_letters(conn, tels=None):
+    """Devolve à fila os telefones em dead-letter (todos ou só 'tels'), zerando as tentativas. Retorna quantos."""
+    result = conn.execute(
+        text(
+            "DELETE FROM public.notification_outbox WHERE status = 'dead' "
+            "AND (CAST(:tels AS text[]) IS NULL OR tel = ANY(:tels))"
+        ),
+        {"tels": list(tels) if tels else None}
+    )
+    conn.commit()
+    return result.rowcount
+
+@timed("notifier_db_seconds", op="daily")
+def daily_sends(conn, day):
+    """Envios já contados no dia 'day' por todas as réplicas: (enviados, esgotado)."""
+    row = conn.execute(
+        text("SELECT sent, exhausted FROM public.notification_daily_sends WHERE day = :day"),
+        {"day": day}
+    ).first()
+    conn.commit()
+    return (row[0], row[1]) if row else (0, False)
+
+@timed("notifier_db_seconds", op="daily")
+def reserve_daily_sends(conn, day, wanted, cap):
+    """
+    Reserva até 'wanted' envios no dia 'day' sem passar de 'cap' no total do
+    dia (None = sem teto). A linha do dia fica travada até o COMMIT, então
+    réplicas simultâneas não reservam a mesma cota; dia esgotado (63038) não
+    reserva nada. Retorna (reservados, total do dia, esgotado).
+    """
+    conn.execute(
+        text("INSERT INTO public.notification_daily_sends (day) VALUES (:day) ON CONFLICT (day) DO NOTHING"),
+        {"day": day}
+    )
+    sent, exhausted = conn.execute(
+        text("SELECT sent, exhausted FROM public.notification_daily_sends WHERE day = :day FOR UPDATE"),
+        {"day": day}
+    ).one()
+    granted = 0 if exhausted else max(0, wanted if cap is None else min(wanted, cap - sent))
+    if granted:
+        conn.execute(
+            text("UPDATE public.notification_daily_sends SET sent = sent + :n WHERE day = :day"),
+            {"day": day, "n": granted}
+        )
+    conn.commit()
+    return granted, sent + granted, exhausted
+
+@timed("notifier_db_seconds", op="daily")
+def release_daily_sends(conn, day, unused, exhausted=False):
+    """
+    Devolve à cota do dia os 'unused' envios reservados e não feitos e, com
+    'exhausted', marca o dia como esgotado para todas as réplicas.
+    Retorna (total do dia, esgotado).
+    """
+    row = conn.execute(
+        text(
+            "UPDATE public.notification_daily_sends "
+            "SET sent = GREATEST(0, sent - :unused), exhausted = exhausted OR :exhausted "
+            "WHERE day = :day RETURNING sent, exhausted"
+        ),
+        {"day": day, "unused": unused, "exhausted": exhausted}
+    ).first()
+    conn.commit()
+    return (row[0], row[1]) if row else (0, exhausted)
+
+@timed("notifier_db_seconds", op="cache_load")
+def load_classifications(conn, hashes, version):
+    """Busca no cache persistente as classificações dos hashes informados: {hash: [(exame, ex_type), ...]}."""
+    hashes = list(hashes)
+    if not hashes:
+        return {}
+    result = conn.execute(
+        text(
+            "SELECT text_hash, result FROM public.notification_classification_cache "
+            "WHERE classifier_version = :version AND text_hash = ANY(:hashes)"
+        ),
+        {"version": version, "hashes": hashes}
+    )
+    found = {h: tuple(map(tuple, res)) for h, res in result}
+    conn.commit()
+    return found
+
+@timed("notifier_db_seconds", op="cache_save")
+def save_classifications(conn, entries, version):
+    """Grava no cache persistente {hash: [(exame, ex_type), ...]} (entradas existentes são mantidas)."""
+    if not entries:
+        return
+    hashes = list(entries)
+    conn.execute(
+        text(
+            "INSERT INTO public.notification_classification_cache (text_hash, classifier_version, result) "
+            "SELECT h, :version, CAST(r AS jsonb) "
+            "FROM unnest(CAST(:hashes AS text[]), CAST(:results AS text[])) AS t(h, r) "
+            "ON CONFLICT DO NOTHING"
+        ),
+        {"version": version, "hashes": hashes, "results": [json.dumps(entries[h]) for h in hashes]}
+    )
+    conn.commit()
+
+def mark_as_notified_by_tel(conn, tel):
+    """
+    Marca todos os registros (notified=false) para esse telefone
+    em 'dados_estruturados' e 'dados_nao_estruturados' como notified=true.
+    """
+    return mark_as_notified_by_tels(conn, [tel])
+
+# Triggers de INSERT que publicam em NOTIFY_CHANNEL (modo USE_LISTEN_NOTIFY).
+# FOR EACH STATEMENT: um INSERT em lote gera um único NOTIFY.
+NOTIFY_TRIGGERS_DDL = [
+    "CREATE OR REPLACE FUNCTION public.notificador_notify_pending() RETURNS trigger AS $$ "
+    "BEGIN PERFORM pg_notify(TG_ARGV[0], TG_TABLE_NAME); RETURN NULL; END; "
+    "$$ LANGUAGE plpgsql",
+] + [
+    stmt.format(tbl=tbl)
+    for tbl in NOTIFY_TABLES
+    for stmt in (
+        "DROP TRIGGER IF EXISTS notificador_notify_pending ON public.{tbl}",
+        "CREATE TRIGGER notificador_notify_pending AFTER INSERT ON public.{tbl} "
+        "FOR EACH STATEMENT EXECUTE FUNCTION public.notificador_notify_pending('%s')" % NOTIFY_CHANNEL,
+    )
+]
+
+_listener = None
+
+def ensure_notify_triggers(conn):
+    """Instala (ou atualiza) os triggers de INSERT das tabelas monitoradas."""
+    for ddl in NOTIFY_TRIGGERS_DDL:
+        conn.execute(text(ddl))
+    conn.commit()
+
+def listen_for_inserts():
+    """
+    Abre uma conexão dedicada (fora do pool, autocommit) com LISTEN em
+    NOTIFY_CHANNEL. Deve ser chamada antes da primeira varredura, para que
+    nenhum NOTIFY entre a varredura e a espera se perca.
+    """
+    global _listener
+    if _listener is None:
+        raw = get_engine().raw_connection()
+        dbapi_conn = raw.driver_connection
+        raw.detach()
+        dbapi_conn.autocommit = True
+        with dbapi_conn.cursor() as cur:
+            cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        _listener = dbapi_conn
+    return _listener
+
+def wait_for_inserts(timeout):
+    """
+    Bloqueia até chegar um NOTIFY de novos registros ou até 'timeout' segundos.
+    Retorna True se houve notificação. Se a conexão cair, ela é reaberta na
+    próxima chamada e retorna True (forçando uma varredura).
+    """
+    global _listener
+    try:
+        conn = listen_for_inserts()
+        if not conn.notifies and select.select([conn], [], [], timeout)[0]:
+            conn.poll()
+        notified = bool(conn.notifies)
+        conn.notifies.clear()
+        return notified
+    except Exception as e:
+        logger.error(f"Conexão LISTEN perdida ({e}). Reabrindo na próxima espera.")
+        _listener = None
+        return True
@@ -0,0 +1,44 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import TWILIO_MAX_WORKERS, TWILIO_RATE_LIMIT
+from infrastructure.rate_limiter import TokenBucket
+from infrastructure.twilio_client import send_message
+from infrastructure.metrics import inc
+
+logger = logging.getLogger("notifier")
+
+# Limite compartilhado entre ciclos: a cota de mensagens/s é da conta, não do chunk.
+rate_limiter = TokenBucket(TWILIO_RATE_LIMIT)
+
+def dispatch_notifications(notifications, max_workers=TWILIO_MAX_WORKERS, errors=None, tenant=None):
+    """
+    Envia as mensagens de um chunk em paralelo.
+    - notifications: iterável de (tel, client_name, exam_list).
+    - No máximo 'max_workers' envios simultâneos, limitados por rate_limiter
+      (ou pelo limite próprio do 'tenant', no modo multi-tenant).
+    - Retorna {tel: True/False} para a marcação em lote.
+    - Se 'errors' (dict) for informado, recebe {tel: erro} das falhas (outbox).
+    """
+    notifications = list(notifications)
+    if not notifications:
+        return {}
+
+    limiter = rate_limiter if tenant is None else tenant.rate_limiter
+    workers = max(1, min(max_workers, len(notifications)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="twilio") as pool:
+        futures = {
+            tel: pool.submit(send_message, tel, c_name, exam_list, limiter, tenant)
+            for tel, c_name, exam_list in notifications
+        }
+        outcomes = {tel: fut.result() for tel, fut in futures.items()}
+
+    results = {tel: ok for tel, (ok, _) in outcomes.items()}
+    if errors is not None:
+        errors.update((tel, err) for tel, (ok, err) in outcomes.items() if not ok)
+
+    sent = sum(results.values())
+    labels = {} if tenant is None else {"tenant": tenant.name}
+    inc("notifier_messages_total", sent, result="sent", **labels)
+    inc("notifier_messages_total", len(results) - sent, result="failed", **labels)
+    logger.info(f"Dispatcher: {sent}/{len(results)} mensagens enviadas ({workers} workers).")
+    return results
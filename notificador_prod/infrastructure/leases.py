@@ -0,0 +1,89 @@
+import logging
+import threading
+from config.settings import WORKER_ID, LEASE_SECONDS
+from infrastructure.database import renew_claims
+from infrastructure.metrics import inc
+
+logger = logging.getLogger("notifier")
+
+class LeaseHeartbeat:
+    """
+    Mantém as reservas dos telefones enquanto eles estão em processamento:
+    1) Uma thread renova, a cada LEASE_SECONDS/3, as reservas de todos os
+       telefones registrados (track), numa conexão própria do engine.
+    2) Telefone cuja reserva já tinha sido retomada por outro worker (renovação
+       atrasada além do prazo) sai do conjunto: held() deixa de devolvê-lo.
+    3) Um lote: with LeaseHeartbeat(engine, claimed): ...; vários lotes em
+       andamento (pipeline): start()/stop() com track()/untrack() por lote.
+    """
+
+    def __init__(self, engine, tels=(), worker_id=WORKER_ID, lease_seconds=LEASE_SECONDS, interval=None):
+        self.engine = engine
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.interval = interval or max(1.0, lease_seconds / 3)
+        self._tels = set(tels)
+        self._lost = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def track(self, tels):
+        """Passa a renovar as reservas de 'tels' (recém-reservados por este worker)."""
+        with self._lock:
+            self._tels.update(tels)
+            self._lost.difference_update(tels)
+
+    def untrack(self, tels):
+        """Para de renovar (reservas liberadas)."""
+        with self._lock:
+            self._tels.difference_update(tels)
+            self._lost.difference_update(tels)
+
+    def held(self, tels):
+        """Telefones de 'tels' cuja reserva não foi perdida."""
+        with self._lock:
+            return [tel for tel in tels if tel not in self._lost]
+
+    def renew(self):
+        """Renova as reservas registradas e separa as perdidas."""
+        with self._lock:
+            tels = list(self._tels)
+        if not tels:
+            return
+        with self.engine.connect() as conn:
+            renewed = set(renew_claims(conn, self.worker_id, tels, self.lease_seconds))
+        with self._lock:
+            # Telefones liberados (untrack) durante a renovação não contam como perdidos
+            lost = [tel for tel in tels if tel not in renewed and tel in self._tels]
+            self._tels.difference_update(lost)
+            self._lost.update(lost)
+        if lost:
+            inc("notifier_leases_lost_total", len(lost))
+            logger.warning(f"Reserva perdida para {len(lost)} telefones (retomados por outro worker); "
+                           "este worker não vai enviá-los.")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.renew()
+            except Exception:
+                logger.exception(f"Erro ao renovar reservas. Nova tentativa em {self.interval:.0f}s.")
@@ -0,0 +1,153 @@
+import time
+import bisect
+import logging
+import threading
+import functools
+from contextlib import nullcontext
+from config.settings import METRICS_ENABLED
+
+logger = logging.getLogger("notifier")
+
+# Limites (segundos) dos buckets dos histogramas de latência
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_metrics = {}  # nome -> {"type", "help", "values": {labels: valor}}
+_NULL_TIMER = nullcontext()
+
+def _series(name, kind, help_text, labels):
+    metric = _metrics.get(name)
+    if metric is None:
+        metric = _metrics[name] = {"type": kind, "help": help_text, "values": {}}
+    return metric["values"], tuple(sorted(labels.items()))
+
+def inc(name, value=1, help_text="", **labels):
+    """Incrementa um contador (no-op com métricas desligadas)."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        values, key = _series(name, "counter", help_text, labels)
+        values[key] = values.get(key, 0) + value
+
+def set_gauge(name, value, help_text="", **labels):
+    """Define o valor atual de um gauge (no-op com métricas desligadas)."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        values, key = _series(name, "gauge", help_text, labels)
+        values[key] = value
+
+def observe(name, seconds, help_text="", **labels):
+    """Registra uma latência no histograma 'name' (no-op com métricas desligadas)."""
+    if not METRICS_ENABLED:
+        return
+    with _lock:
+        values, key = _series(name, "histogram", help_text, labels)
+        hist = values.get(key)
+        if hist is None:
+            hist = values[key] = [[0] * (len(LATENCY_BUCKETS) + 1), 0.0, 0]
+        hist[0][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        hist[1] += seconds
+        hist[2] += 1
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+def timer(name, **labels):
+    """Context manager que mede o bloco no histograma 'name'."""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+def timed(name, **labels):
+    """
+    Decorador que mede a função no histograma 'name'. Com métricas
+    desligadas devolve a própria função (custo zero).
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+def render():
+    """Exporta todas as métricas no formato texto do Prometheus."""
+    lines = []
+    with _lock:
+        for name, metric in sorted(_metrics.items()):
+            if metric["help"]:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in metric["values"].items():
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+                    continue
+                buckets, total, count = value
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+    return "\n".join(lines) + "\n"
+
+def counter_totals(name):
+    """Retorna {labels: valor} do contador 'name' (para relatórios)."""
+    with _lock:
+        return dict(_metrics.get(name, {}).get("values", {}))
+
+def histogram_totals(name):
+    """Retorna {labels: (quantidade, soma)} do histograma 'name' (para relatórios)."""
+    with _lock:
+        values = _metrics.get(name, {}).get("values", {})
+        return {key: (hist[2], hist[1]) for key, hist in values.items()}
+
+def start_metrics_server(port):
+    """Sobe o endpoint /metrics em uma thread daemon (somente se METRICS_ENABLED)."""
+    if not METRICS_ENABLED:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Import local: só com métricas ligadas
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Métricas Prometheus em http://0.0.0.0:{port}/metrics")
+    return server
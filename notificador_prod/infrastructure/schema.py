@@ -0,0 +1,156 @@
+import logging
+from sqlalchemy import text
+from config.settings import SCHEMA_CHECK_MIN_ROWS
+from infrastructure.database import NOTIFY_TABLES, ensure_service_tables
+
+logger = logging.getLogger("notifier")
+
+# Tabelas monitoradas do ambiente de testes (notificador_test)
+TEST_TABLES = [f"{tbl}_test" for tbl in NOTIFY_TABLES]
+
+# Colunas de cada tabela monitorada (as de _test seguem a tabela de produção)
+DATA_TABLE_COLUMNS = {
+    "dados_estruturados": [
+        ("id", "bigint PRIMARY KEY"), ("data", "date"), ("tel", "text"), ("cpf", "text"),
+        ("solicitante", "text"), ("cd_tuss", "bigint"), ("ds_receita", "text"),
+        ("notified", "boolean NOT NULL DEFAULT false"),
+    ],
+    "dados_nao_estruturados": [
+        ("id", "bigint PRIMARY KEY"), ("data", "date"), ("tel", "text"), ("cpf", "text"),
+        ("solicitante", "text"), ("ds_receita", "text"),
+        ("notified", "boolean NOT NULL DEFAULT false"),
+    ],
+}
+
+# Índices parciais: só as linhas pendentes, então o tamanho acompanha o backlog
+# e não as dezenas de milhões de registros já notificados.
+# - pending_id: WHERE NOT notified ORDER BY id LIMIT (claim_pending_tels, scan_pending_tels)
+# - pending_tel: tel = ANY(...) AND NOT notified (READ_CLAIMED_SQL, COPY_CLAIMED_SQL; a marcação usa o id)
+PENDING_INDEXES = [("pending_id", "id"), ("pending_tel", "tel")]
+
+# Consultas quentes conferidas pelo EXPLAIN (check_query_plans)
+HOT_QUERIES = {
+    "pending_id": "SELECT id, tel FROM public.{tbl} WHERE NOT notified ORDER BY id LIMIT 1000",
+    "pending_tel": "SELECT id FROM public.{tbl} WHERE tel = ANY(CAST(:tels AS text[])) AND NOT notified",
+}
+_SAMPLE_TELS = [f"check-{i}" for i in range(100)]
+
+def table_set(name):
+    """Tabelas monitoradas de 'prod', 'test' ou 'all'."""
+    return {"prod": NOTIFY_TABLES, "test": TEST_TABLES, "all": NOTIFY_TABLES + TEST_TABLES}[name]
+
+def _base_table(tbl):
+    return tbl[:-len("_test")] if tbl.endswith("_test") else tbl
+
+def ensure_data_tables(conn, tables, create=True):
+    """
+    Cria as tabelas monitoradas ausentes (se 'create') e confere as colunas
+    usadas pelo serviço. Retorna {tabela: [colunas ausentes]} das que têm problema.
+    """
+    problems = {}
+    for tbl in tables:
+        columns = DATA_TABLE_COLUMNS[_base_table(tbl)]
+        if create:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS public.{tbl} ({', '.join(f'{c} {t}' for c, t in columns)})"
+            ))
+        existing = {row[0] for row in conn.execute(
+            text("SELECT column_name FROM information_schema.columns "
+                 "WHERE table_schema = 'public' AND table_name = :tbl"),
+            {"tbl": tbl}
+        )}
+        missing = [c for c, _ in columns if c not in existing]
+        if missing:
+            problems[tbl] = missing
+            logger.error(f"Schema: {tbl} " + ("não existe." if not existing else f"sem as colunas {missing}."))
+    conn.commit()
+    return problems
+
+def ensure_pending_indexes(engine, tables, create=True):
+    """
+    Cria os índices parciais PENDING_INDEXES com CREATE INDEX CONCURRENTLY (sem
+    bloquear INSERT/UPDATE em tabelas grandes). Um índice inválido (build
+    concorrente interrompido) é removido e recriado. Retorna os índices ausentes
+    ou inválidos restantes.
+    """
+    missing = []
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for tbl in tables:
+            for suffix, column in PENDING_INDEXES:
+                name = f"{tbl}_{suffix}_idx"
+                valid = conn.execute(
+                    text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                         "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                         "WHERE n.nspname = 'public' AND c.relname = :name"),
+                    {"name": name}
+                ).scalar()
+                if valid:
+                    continue
+                if not create:
+                    missing.append(name)
+                    logger.warning(f"Schema: índice {name} " + ("inválido." if valid is False else "ausente."))
+                    continue
+                if valid is False:
+                    logger.warning(f"Schema: índice {name} inválido. Recriando.")
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS public.{name}"))
+                logger.info(f"Schema: criando {name} ON {tbl} ({column}) WHERE NOT notified...")
+                conn.execute(text(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON public.{tbl} ({column}) WHERE NOT notified"
+                ))
+                conn.execute(text(f"ANALYZE public.{tbl}"))
+    return missing
+
+def _seq_scans(plan, tbl):
+    """True se algum nó do plano (JSON do EXPLAIN) é Seq Scan na tabela."""
+    if plan.get("Node Type") == "Seq Scan" and plan.get("Relation Name") == tbl:
+        return True
+    return any(_seq_scans(child, tbl) for child in plan.get("Plans", ()))
+
+def check_query_plans(conn, tables, min_rows=SCHEMA_CHECK_MIN_ROWS):
+    """
+    Confere com EXPLAIN (sem executar) se as consultas quentes (HOT_QUERIES)
+    usam índice em cada tabela. Tabelas com menos de 'min_rows' linhas
+    estimadas são ignoradas (lá o Seq Scan é a escolha certa).
+    Loga um aviso por regressão e retorna a lista [(tabela, consulta)].
+    """
+    regressions = []
+    for tbl in tables:
+        rows = conn.execute(
+            text("SELECT c.reltuples FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                 "WHERE n.nspname = 'public' AND c.relname = :tbl"),
+            {"tbl": tbl}
+        ).scalar()
+        if rows is None or rows < min_rows:
+            continue
+        for name, sql in HOT_QUERIES.items():
+            plan = conn.execute(
+                text(f"EXPLAIN (FORMAT JSON) {sql.format(tbl=tbl)}"), {"tels": _SAMPLE_TELS}
+            ).scalar()
+            if _seq_scans(plan[0]["Plan"], tbl):
+                regressions.append((tbl, name))
+                logger.warning(f"Schema: consulta {name} em {tbl} (~{int(rows)} linhas) faz Seq Scan. "
+                               "Rode `python main.py schema` para criar os índices parciais.")
+    conn.rollback()
+    return regressions
+
+def bootstrap_schema(engine, tables, create=True):
+    """
+    Comando `python main.py schema`:
+    1) Cria (ou só confere, se not 'create') as tabelas monitoradas e as
+       tabelas de controle do serviço (estas só para as de produção).
+    2) Cria os índices parciais WHERE NOT notified (CONCURRENTLY).
+    3) Confere os planos das consultas quentes (check_query_plans).
+    Retorna True se não restou problema.
+    """
+    with engine.connect() as conn:
+        problems = ensure_data_tables(conn, tables, create)
+        if create and set(tables) & set(NOTIFY_TABLES):
+            ensure_service_tables(conn)
+    tables = [tbl for tbl in tables if tbl not in problems]
+    missing = ensure_pending_indexes(engine, tables, create)
+    with engine.connect() as conn:
+        regressions = check_query_plans(conn, tables)
+    ok = not (problems or missing or regressions)
+    logger.info(f"Schema {'ok' if ok else 'com problemas'}: {len(tables)} tabelas conferidas, "
+                f"{len(missing)} índices ausentes, {len(regressions)} planos com Seq Scan.")
+    return ok
@@ -1,42 +1,148 @@
-from twilio.rest import Client
+import re
+import time
 import logging
-from config.settings import TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER, USE_SANDBOX
+import threading
+from config.settings import (
+    TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_FROM_NUMBER, USE_SANDBOX,
+    TWILIO_MAX_WORKERS, TWILIO_MAX_RETRIES, TWILIO_API_BASE_URL,
+)
 from domain.exam_utils import build_message_for_exams
+from infrastructure.metrics import inc, timer
 
 logger = logging.getLogger("notifier")
 
-def send_notification(to_number, client_name, exam_list):
+TWILIO_API_URL = "https://api.twilio.com"
+DAILY_LIMIT_CODE = "63038"
+# Erros do destinatário (número inválido, sem WhatsApp, descadastrado, região bloqueada):
+# só esses contam tentativa na outbox; os demais (5xx, timeout, 429) são passageiros
+RECIPIENT_ERROR_CODES = ("21211", "21408", "21610", "21612", "21614", "63003", "63024")
+RECIPIENT_ERROR_RE = re.compile(r"\b(?:" + "|".join(RECIPIENT_ERROR_CODES) + r")\b")
+
+_client = None
+_client_lock = threading.Lock()
+
+def _pooled_http_client(base_url=None, pool_size=TWILIO_MAX_WORKERS):
+    """
+    HTTP client do Twilio com uma única Session (pool de conexões) dimensionada
+    para os workers do dispatcher e, opcionalmente, apontada para outro host
+    (TWILIO_API_BASE_URL), ex.: o fake local de benchmarks/fake_twilio.py.
+    O twilio/requests só são importados aqui, no primeiro envio real.
+    """
+    from requests.adapters import HTTPAdapter
+    from twilio.http.http_client import TwilioHttpClient
+
+    class PooledHttpClient(TwilioHttpClient):
+        def __init__(self):
+            super().__init__(pool_connections=True, timeout=30)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+            self.base_url = base_url.rstrip("/") if base_url else None
+
+        def request(self, method, url, *args, **kwargs):
+            if self.base_url and url.startswith(TWILIO_API_URL):
+                url = self.base_url + url[len(TWILIO_API_URL):]
+            return super().request(method, url, *args, **kwargs)
+
+    return PooledHttpClient()
+
+def create_client(account_sid, auth_token):
+    """Cria um Client do Twilio com o pool de conexões (_pooled_http_client)."""
+    from twilio.rest import Client  # Import local: evita carregar o twilio.rest no cold start
+    return Client(account_sid, auth_token, http_client=_pooled_http_client(TWILIO_API_BASE_URL))
+
+def get_client():
+    """Retorna o Client do Twilio compartilhado (criado uma única vez)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    return _client
+
+def is_daily_limit_error(error):
+    """True se o erro é o limite diário da conta (63038), e não um problema do telefone."""
+    return DAILY_LIMIT_CODE in (error or "")
+
+def is_recipient_error(error):
+    """True se o erro é do telefone de destino (repetir não adianta), e não do provedor ou da rede."""
+    return RECIPIENT_ERROR_RE.search(error or "") is not None
+
+def send_notification(to_number, client_name, exam_list, rate_limiter=None, tenant=None):
+    """Igual a send_message, retornando apenas True/False."""
+    return send_message(to_number, client_name, exam_list, rate_limiter, tenant)[0]
+
+def send_message(to_number, client_name, exam_list, rate_limiter=None, tenant=None):
     """
     - Monta a mensagem bullet.
-    - Envia via Twilio (Sandbox ou Produção).
+    - Envia via Twilio (Sandbox ou Produção), reaproveitando o Client/pool.
+    - Com 'tenant', usa o template, a conta e o número de origem da clínica.
+    - Respeita o rate_limiter (TokenBucket) a cada tentativa, se informado.
+    - Em HTTP 429, aguarda com backoff exponencial e tenta de novo.
     - Trata o erro 63038 (limite diário em testes).
+    - Retorna (ok, erro): erro é None em caso de sucesso. Nunca propaga exceção
+      (uma linha ruim não derruba o chunk).
     """
+    to_number = str(to_number)
     if not to_number.startswith("whatsapp:"):
         to_number = "whatsapp:+55" + to_number
 
-    msg_body = build_message_for_exams(client_name, exam_list)
+    try:
+        if tenant is None:
+            msg_body = build_message_for_exams(client_name, exam_list)
+            account_sid, use_sandbox, from_number = TWILIO_ACCOUNT_SID, USE_SANDBOX, TWILIO_FROM_NUMBER
+        else:
+            msg_body = tenant.template.render(client_name, exam_list)
+            account_sid, use_sandbox, from_number = tenant.twilio_account_sid, tenant.use_sandbox, tenant.from_number
+    except Exception as e:
+        # Registro inválido falha só a própria mensagem, não o chunk inteiro
+        return False, _log_send_error(client_name, to_number, e)
 
     # Se mockado
-    if TWILIO_ACCOUNT_SID == "TWILIO_ACCOUNT_SID":
+    if account_sid == "TWILIO_ACCOUNT_SID":
         logger.info(f"(Simulação) Mensagem para {client_name} ({to_number}):\n{msg_body}")
-        return True
+        return True, None
 
-    from_number = "whatsapp:+14155238886" if USE_SANDBOX else TWILIO_FROM_NUMBER
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    from twilio.base.exceptions import TwilioRestException  # Import local: só em envios reais
 
-    try:
-        message = twilio_client.messages.create(
-            from_=from_number,
-            body=msg_body,
-            to=to_number
-        )
-        logger.info(f"Mensagem enviada para {client_name} ({to_number}). SID={message.sid}")
-        return True
-    except Exception as e:
-        err_str = str(e)
-        if "63038" in err_str:
-            logger.warning(f"Limite diário atingido para {client_name} ({to_number}).")
-            return False
-        else:
-            logger.error(f"Erro ao enviar p/ {client_name} ({to_number}): {e}")
-            return False
+    if use_sandbox:
+        from_number = "whatsapp:+14155238886"
+    twilio_client = get_client() if tenant is None else tenant.twilio_client()
+
+    for attempt in range(TWILIO_MAX_RETRIES + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            with timer("notifier_provider_seconds"):
+                message = twilio_client.messages.create(
+                    from_=from_number,
+                    body=msg_body,
+                    to=to_number
+                )
+            inc("notifier_provider_requests_total", result="ok")
+            logger.info(f"Mensagem enviada para {client_name} ({to_number}). SID={message.sid}")
+            return True, None
+        except TwilioRestException as e:
+            inc("notifier_provider_requests_total", result="error", code=e.code or e.status)
+            if e.status == 429 and attempt < TWILIO_MAX_RETRIES:
+                delay = 2 ** attempt
+                logger.warning(f"HTTP 429 para {client_name} ({to_number}). Nova tentativa em {delay}s.")
+                time.sleep(delay)
+                continue
+            return False, _log_send_error(client_name, to_number, e)
+        except Exception as e:
+            inc("notifier_provider_requests_total", result="error", code="other")
+            return False, _log_send_error(client_name, to_number, e)
+    return False, "429: tentativas esgotadas"
+
+def _log_send_error(client_name, to_number, e):
+    """Loga a falha e retorna a descrição do erro (com o código do Twilio, se houver)."""
+    err_str = str(e)
+    code = getattr(e, "code", None)
+    if code and str(code) not in err_str:
+        err_str = f"{code}: {err_str}"
+    if is_daily_limit_error(err_str):
+        logger.warning(f"Limite diário atingido para {client_name} ({to_number}).")
+    else:
+        logger.error(f"Erro ao enviar p/ {client_name} ({to_number}): {e}")
+    return err_str
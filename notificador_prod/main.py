@@ -1,4 +1,57 @@
-from application.notification_service import main
+import argparse
+from config.settings import BATCH_CHUNK_ROWS, BATCH_PARTITIONS, BATCH_PARTITION_BYTES, CLASSIFY_PROCESSES
+
+def parse_args(argv=None):
+    once = argparse.ArgumentParser(add_help=False)
+    once.add_argument("--once", action="store_true", default=argparse.SUPPRESS,
+                      help="processa o backlog até esvaziar e sai (execução agendada)")
+
+    parser = argparse.ArgumentParser(description="Notificador de exames pendentes.", parents=[once])
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("run", parents=[once], help="serviço contínuo a partir do banco (padrão)")
+
+    batch = commands.add_parser("batch", help="processa exportações CSV sem banco e gera a outbox em JSONL")
+    batch.add_argument("csv", nargs="+", help="arquivos no formato de data/sample_*.csv")
+    batch.add_argument("--out", required=True, help="arquivo JSONL de saída (resumo em <out>.summary.json)")
+    batch.add_argument("--chunk-rows", type=int, default=BATCH_CHUNK_ROWS)
+    batch.add_argument("--partitions", type=int, default=BATCH_PARTITIONS)
+    batch.add_argument("--partition-bytes", type=int, default=BATCH_PARTITION_BYTES,
+                       help="tamanho máximo de uma partição no disco; as maiores são re-divididas")
+    batch.add_argument("--processes", type=int, default=CLASSIFY_PROCESSES)
+    batch.add_argument("--tmp-dir", help="diretório dos arquivos temporários (padrão: o do sistema)")
+
+    tuss = commands.add_parser("tuss-index", help="compila a terminologia TUSS (CSV) no índice binário (mmap)")
+    tuss.add_argument("csv", help="CSV com as colunas codigo, exame e ex_type")
+    tuss.add_argument("--out", required=True, help="arquivo .bin de saída (use em TUSS_INDEX_FILE)")
+
+    requeue = commands.add_parser("requeue", help="devolve à fila os telefones em dead-letter da outbox")
+    requeue.add_argument("tels", nargs="*", help="telefones a devolver (padrão: todos em dead-letter)")
+
+    schema = commands.add_parser("schema", help="cria/confere as tabelas e os índices parciais das consultas quentes")
+    schema.add_argument("--tables", choices=["prod", "test", "all"], default="prod",
+                        help="tabelas de produção, as _test do notificador_test ou ambas")
+    schema.add_argument("--check", action="store_true", help="só confere (sem DDL); sai com código 1 se houver problema")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    if args.command == "batch":
+        from application.batch import run_batch
+        run_batch(args.csv, args.out, chunk_rows=args.chunk_rows, partitions=args.partitions,
+                  partition_bytes=args.partition_bytes, processes=args.processes, tmp_dir=args.tmp_dir)
+    elif args.command == "tuss-index":
+        from domain.exam_utils import TUSS_EXAMS
+        from domain.tuss_index import load_tuss_index
+        load_tuss_index(args.csv, base=TUSS_EXAMS).save(args.out)
+    elif args.command == "schema":
+        import sys
+        from infrastructure.database import get_engine
+        from infrastructure.schema import bootstrap_schema, table_set
+        sys.exit(0 if bootstrap_schema(get_engine(), table_set(args.tables), create=not args.check) else 1)
+    elif args.command == "requeue":
+        from infrastructure.database import get_engine, requeue_dead_letters
+        with get_engine().connect() as conn:
+            print(f"{requeue_dead_letters(conn, args.tels)} telefones devolvidos à fila.")
+    else:
+        from application.notification_service import main
+        main(once=getattr(args, "once", False))